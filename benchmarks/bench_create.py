@@ -0,0 +1,236 @@
+'''
+Benchmark create_adjforms.py on a synthetic exam cycle
+-- writes a form-responses .tsv at the chosen scale (candidates, pieces per candidate, jurors,
+   share of candidates who resubmitted their program)
+-- runs each form stage on it in a forked child process, so each stage's CPU time and peak RSS
+   are its own: reading the .tsv, adjudication forms, required piece form, repertoire piece form,
+   program listing (including pdflatex, if installed)
+-- reports wall and CPU time, throughput, peak RSS and files written for each stage,
+   and saves them as .json for comparing runs
+
+Runs in a temporary directory (or --workdir), with copies of the .docx templates.
+Needs os.fork and os.wait4, so a *nix-like OS.
+
+
+USAGE (from the repository directory):
+
+$ python3 benchmarks/bench_create.py
+$ python3 benchmarks/bench_create.py --candidates 40 --pieces 6 --jurors 9 --resubmit 0.3 --jobs 4 --out bench_create.json
+$ python3 benchmarks/bench_create.py --fanout bundle
+'''
+
+import argparse
+import importlib
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+
+# repository directory, holding create_adjforms.py and the templates
+repodir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,repodir)
+
+import create_adjforms
+import pdflatex_runner
+
+
+def make_tsv(tsvfile,numcands,numpieces,resubmit,seed=0):
+
+    # write synthetic form responses: candidates 1..numcands, numpieces pieces each,
+    #    one technical and one expressive piece taken from the standard required piece titles
+    # each candidate resubmits (an earlier, superseded row) with probability resubmit
+    # returns the number of response rows
+
+    r = random.Random(seed)
+    reqtitles = sorted(create_adjforms.req_piece_std_format.values())
+
+    header = ['Timestamp','Candidate number']
+    for ind in range(numpieces):
+        header += ['Piece '+str(ind+1),'Composer '+str(ind+1),'Type '+str(ind+1)]
+
+    rows = []
+    for cand in range(1,numcands+1):
+        versions = 2 if r.random() < resubmit else 1
+        for version in range(versions):
+            tech,exp = r.sample(range(numpieces),2)
+            techtitle,exptitle = r.sample(reqtitles,2)
+            row = ['2022-01-'+'%02d' % (version+1),str(cand)]
+            for ind in range(numpieces):
+                if ind == tech:
+                    row += [techtitle,'Composer '+str(ind),'Technical']
+                elif ind == exp:
+                    row += [exptitle,'Composer '+str(ind),'Expressive']
+                else:
+                    row += ['Repertoire piece '+str(cand)+'-'+str(ind)+' v'+str(version),'Composer '+str(ind),'Repertoire']
+            rows.append(row)
+
+    # superseded rows come first, as in a real export sorted by timestamp
+    rows.sort(key=lambda row:row[0])
+
+    with open(tsvfile,'w') as fh:
+        for row in [header]+rows:
+            _ = fh.write('\t'.join(row)+'\n')
+
+    return len(rows)
+
+
+def dir_snapshot(dirname):
+
+    # size and mtime of every file under dirname
+
+    snapshot = {}
+    for root,dirs,files in os.walk(dirname):
+        for name in files:
+            path = os.path.join(root,name)
+            stat = os.stat(path)
+            snapshot[path] = (stat.st_size,stat.st_mtime_ns)
+
+    return snapshot
+
+
+def run_stage(name,stage,items,unit,workdir):
+
+    # run stage() in a forked child process and measure it
+    # returns dictionary of measurements for the report
+
+    before = dir_snapshot(workdir)
+
+    start = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        status = 0
+        try:
+            stage()
+            create_adjforms.close_bundles()
+            pdflatex_runner.wait_pdflatex()
+        except BaseException as err:
+            print(name+' failed : '+repr(err))
+            status = 1
+        sys.stdout.flush()
+        os._exit(status)
+    _,status,usage = os.wait4(pid,0)
+    wall = time.perf_counter() - start
+
+    after = dir_snapshot(workdir)
+    written = [path for path in after if before.get(path) != after[path]]
+
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    maxrss = usage.ru_maxrss // 1024 if sys.platform == 'darwin' else usage.ru_maxrss
+
+    return {'stage':name,
+            'ok':os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0,
+            'wall_s':round(wall,4),
+            'cpu_s':round(usage.ru_utime+usage.ru_stime,4),
+            'items':items,
+            'unit':unit,
+            'items_per_s':round(items/wall,2) if wall > 0 else None,
+            'peak_rss_kb':maxrss,
+            'files_written':len(written),
+            'bytes_written':sum(after[path][0] for path in written)}
+
+
+def run_benchmark(numcands,numpieces,numjurors,resubmit,jobs,workdir,seed=0):
+
+    # set up synthetic cycle in workdir and run all stages; returns list of stage measurements
+
+    for template in [create_adjforms.template1,create_adjforms.template2,create_adjforms.template3,create_adjforms.template4]:
+        shutil.copy(os.path.join(repodir,template),workdir)
+    os.chdir(workdir)
+
+    tsvfile = 'bench_responses.tsv'
+    numrows = make_tsv(tsvfile,numcands,numpieces,resubmit,seed)
+    create_adjforms.jurors = ['juror'+'%02d' % (ind+1) for ind in range(numjurors)]
+
+    # heavy imports are done once here, so the stages measure form building only
+    start = time.perf_counter()
+    for module in ['docx','docxcompose.composer','mailmerge']:
+        importlib.import_module(module)
+    stages = [{'stage':'imports','ok':True,'wall_s':round(time.perf_counter()-start,4)}]
+
+    # the parent reads the .tsv too, to hand each stage its inputs
+    piecedict = create_adjforms.tsv_to_piecedict(tsvfile)
+    candidates = sorted(list(piecedict.keys()),key=int)
+    reqpiecedict = create_adjforms.get_reqpiecedict(candidates,piecedict)
+
+    stages.append(run_stage('tsv_to_piecedict',lambda: create_adjforms.tsv_to_piecedict(tsvfile),
+                            numrows,'rows',workdir))
+    stages.append(run_stage('adjudication',lambda: create_adjforms.make_adjforms(candidates,piecedict,jobs),
+                            len(candidates),'packets',workdir))
+    stages.append(run_stage('required',lambda: create_adjforms.make_reqform(candidates,reqpiecedict),
+                            numjurors,'files',workdir))
+    stages.append(run_stage('repertoire',lambda: create_adjforms.make_repform(candidates),
+                            numjurors,'files',workdir))
+    stages.append(run_stage('program',lambda: create_adjforms.make_progfile(candidates,piecedict),
+                            len(candidates),'candidates',workdir))
+
+    return stages
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='benchmark create_adjforms.py on a synthetic exam cycle')
+    parser.add_argument('--candidates',type=int,default=12,metavar='N',help='number of candidates (default 12)')
+    parser.add_argument('--pieces',type=int,default=5,metavar='N',help='pieces per candidate, 2 to 8 (default 5)')
+    parser.add_argument('--jurors',type=int,default=7,metavar='N',help='number of jurors (default 7)')
+    parser.add_argument('--resubmit',type=float,default=0.2,metavar='RATE',
+                        help='share of candidates who resubmitted their program (default 0.2)')
+    parser.add_argument('--jobs',type=int,default=1,metavar='N',help='worker processes for adjudication forms (default 1)')
+    parser.add_argument('--fanout',default=create_adjforms.fanout,choices=['copy','hardlink','reflink','bundle'],
+                        help='how juror copies are placed, as the fanout parameter (default: its value)')
+    parser.add_argument('--seed',type=int,default=0,help='random seed for the synthetic programs (default 0)')
+    parser.add_argument('--workdir',metavar='DIR',help='directory to build in, kept afterwards (default: temporary)')
+    parser.add_argument('--out',default='bench_create.json',metavar='FILE',help='report file (default bench_create.json)')
+    args = parser.parse_args(argv)
+
+    # the program listing labels pieces a) to h)
+    if not 2 <= args.pieces <= 8:
+        parser.error('--pieces must be between 2 and 8')
+
+    create_adjforms.fanout = args.fanout
+    outfile = os.path.abspath(args.out)
+    cwd = os.getcwd()
+
+    if args.workdir:
+        workdir = os.path.abspath(args.workdir)
+        os.makedirs(workdir,exist_ok=True)
+    else:
+        workdir = tempfile.mkdtemp(prefix='bench_create_')
+
+    try:
+        stages = run_benchmark(args.candidates,args.pieces,args.jurors,args.resubmit,args.jobs,workdir,args.seed)
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir)
+
+    report = {'benchmark':'create_adjforms',
+              'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python':platform.python_version(),
+              'platform':platform.platform(),
+              'cpus':os.cpu_count(),
+              'params':{'candidates':args.candidates,'pieces':args.pieces,'jurors':args.jurors,
+                        'resubmit':args.resubmit,'jobs':args.jobs,'seed':args.seed,
+                        'fanout':create_adjforms.fanout},
+              'stages':stages}
+
+    with open(outfile,'w') as fh:
+        json.dump(report,fh,indent=4)
+
+    for stage in stages:
+        line = '%-18s %8.3f s wall' % (stage['stage'],stage['wall_s'])
+        if 'cpu_s' in stage:
+            line += '  %8.3f s cpu  %9.1f %s/s  %8d kB peak  %5d files' % (stage['cpu_s'],stage['items_per_s'] or 0,
+                                                                         stage['unit'],stage['peak_rss_kb'],stage['files_written'])
+        if not stage['ok']:
+            line += '  FAILED'
+        print(line)
+    print('report saved to '+outfile)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+'''
+Benchmark parse_adjforms.py on synthetic returned forms, and check what it reads against the marks filled in
+-- makes blank forms for a synthetic exam cycle with create_adjforms.py (see bench_create.py)
+-- fills them as jurors do with make_returned_forms.py, keeping the truth of every mark
+-- times reading the adjudication forms (fast reader and python-docx), reading the repertoire and
+   required piece forms, recording everything in the results store, and writing the summaries
+   (including the combined adjudications for each candidate and the LaTeX voting summary)
+-- compares the grades, overall marks and votes read with the truth, and lists any mismatches
+-- saves timings and mismatch counts as .json for comparing runs
+
+Runs in a temporary directory (or --workdir).
+
+
+USAGE (from the repository directory):
+
+$ python3 benchmarks/bench_parse.py
+$ python3 benchmarks/bench_parse.py --candidates 20 --jurors 9 --jobs 4 --out bench_parse.json
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+import bench_create
+import make_returned_forms
+
+# bench_create has put the repository directory on the path
+import create_adjforms
+import parse_adjforms
+import pdflatex_runner
+
+
+def timed(name,func,items,unit,quiet=True):
+
+    # run func(), with its printed alerts discarded if quiet; returns (result, measurements)
+
+    start = time.perf_counter()
+    cpustart = time.process_time()
+    if quiet:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func()
+    else:
+        result = func()
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpustart
+
+    return result,{'stage':name,
+                   'wall_s':round(wall,4),
+                   'cpu_s':round(cpu,4),
+                   'items':items,
+                   'unit':unit,
+                   'ms_per_item':round(1000*wall/items,3) if items else None}
+
+
+def check_truth(records,repvotes,reqvotes,truth):
+
+    # compare what was read with the marks filled in; returns list of mismatch descriptions
+
+    mismatches = []
+
+    for filename,record in records.items():
+        expected = truth['adjudication'][filename]
+        if record.candidate != expected['candidate']:
+            mismatches.append(filename+' : candidate '+record.candidate+', filled in '+expected['candidate'])
+        if list(record.grades) != expected['grades']:
+            mismatches.append(filename+' : grades '+str(list(record.grades))+', filled in '+str(expected['grades']))
+        if record.overall != expected['overall']:
+            mismatches.append(filename+' : overall "'+record.overall+'", filled in "'+expected['overall']+'"')
+
+    for juror,votes in repvotes.items():
+        read = {row[0]:row[1:] for row in votes}
+        if read != truth['repertoire'][juror]:
+            mismatches.append(juror+' repertoire : '+str(read)+', filled in '+str(truth['repertoire'][juror]))
+
+    for juror,votes in reqvotes.items():
+        read = {row[0]:row[3] for row in votes}
+        if read != truth['required'][juror]:
+            mismatches.append(juror+' required : '+str(read)+', filled in '+str(truth['required'][juror]))
+
+    return mismatches
+
+
+def run_benchmark(numcands,numpieces,numjurors,jobs,workdir,seed=0):
+
+    # make blank and returned forms in workdir and time parsing them
+    # returns (list of stage measurements, list of mismatches)
+
+    blankdir = os.path.join(workdir,'blank')
+    returndir = os.path.join(workdir,'returned')
+    os.makedirs(blankdir,exist_ok=True)
+    for template in [create_adjforms.template1,create_adjforms.template2,create_adjforms.template3,create_adjforms.template4]:
+        shutil.copy(os.path.join(bench_create.repodir,template),blankdir)
+
+    jurors = ['juror'+'%02d' % (ind+1) for ind in range(numjurors)]
+
+    # blank forms, as create_adjforms.py makes them
+    os.chdir(blankdir)
+    bench_create.make_tsv('bench_responses.tsv',numcands,numpieces,0,seed)
+    create_adjforms.jurors = jurors
+    piecedict = create_adjforms.tsv_to_piecedict('bench_responses.tsv')
+    candidates = sorted(list(piecedict.keys()),key=int)
+    create_adjforms.make_adjforms(candidates,piecedict,jobs)
+    create_adjforms.make_reqform(candidates,create_adjforms.get_reqpiecedict(candidates,piecedict))
+    create_adjforms.make_repform(candidates)
+
+    # returned forms, as jurors fill them in
+    truth = make_returned_forms.make_returned_forms(blankdir,returndir,seed)
+
+    # parameters for this cycle; the first parse_adjforms.numrequired jurors vote
+    os.chdir(returndir)
+    parse_adjforms.jurors = jurors
+    parse_adjforms.candidates = candidates
+    parse_adjforms.voting = jurors[:parse_adjforms.numrequired]
+    parse_adjforms.conflict = {}
+
+    stages = []
+
+    formindex,stage = timed('index_forms',lambda: parse_adjforms.index_forms(jurors),len(os.listdir('.')),'files')
+    stages.append(stage)
+
+    adjfiles = [name for juror in jurors for name in parse_adjforms.indexed_forms(formindex,juror,'adjudication')]
+    repfiles = {juror:parse_adjforms.indexed_forms(formindex,juror,'repertoire')[0] for juror in jurors}
+    reqfiles = {juror:parse_adjforms.indexed_forms(formindex,juror,'required')[0] for juror in jurors}
+
+    def read_adjforms(fast):
+        parse_adjforms.fast_extract = fast
+        return {name:parse_adjforms.load_adjrecord(name) for name in adjfiles}
+
+    _,stage = timed('adjudication_docx',lambda: read_adjforms(False),len(adjfiles),'forms')
+    stages.append(stage)
+    records,stage = timed('adjudication_fast',lambda: read_adjforms(True),len(adjfiles),'forms')
+    stages.append(stage)
+
+    repvotes,stage = timed('repertoire',lambda: {juror:parse_adjforms.read_repvotes(parse_adjforms.Document(name))
+                                                 for juror,name in repfiles.items()},len(repfiles),'forms')
+    stages.append(stage)
+    reqvotes,stage = timed('required',lambda: {juror:parse_adjforms.read_reqvotes(parse_adjforms.Document(name))
+                                               for juror,name in reqfiles.items()},len(reqfiles),'forms')
+    stages.append(stage)
+
+    def record_all():
+        results = parse_adjforms.ResultsStore(candidates,jurors)
+        for juror in jurors:
+            for name in parse_adjforms.indexed_forms(formindex,juror,'adjudication'):
+                results = parse_adjforms.record_grades(results,records[name],juror)
+                results = parse_adjforms.record_overall(results,records[name],juror)
+            results = parse_adjforms.record_repvotes(repvotes[juror],results,juror)
+            results = parse_adjforms.record_reqvotes(reqvotes[juror],results,juror)
+        return results
+
+    results,stage = timed('record',record_all,len(adjfiles)+2*len(jurors),'forms')
+    stages.append(stage)
+
+    def write_all():
+        parse_adjforms.write_results(results,formindex,jobs=jobs)
+        pdflatex_runner.wait_pdflatex()
+
+    _,stage = timed('summaries',write_all,len(candidates),'candidates')
+    stages.append(stage)
+
+    # the whole script, as run on results day, without the parse cache
+    _,stage = timed('parse_adjforms',lambda: parse_adjforms.main(['--no-cache','--jobs',str(jobs)]),len(adjfiles),'forms')
+    stages.append(stage)
+
+    return stages,check_truth(records,repvotes,reqvotes,truth)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='benchmark parse_adjforms.py on synthetic returned forms')
+    parser.add_argument('--candidates',type=int,default=12,metavar='N',help='number of candidates (default 12)')
+    parser.add_argument('--pieces',type=int,default=5,metavar='N',help='pieces per candidate, 2 to 8 (default 5)')
+    parser.add_argument('--jurors',type=int,default=7,metavar='N',help='number of jurors, at least 5 (default 7)')
+    parser.add_argument('--jobs',type=int,default=1,metavar='N',help='worker processes, as for the form scripts (default 1)')
+    parser.add_argument('--seed',type=int,default=0,help='random seed for programs and marks (default 0)')
+    parser.add_argument('--workdir',metavar='DIR',help='directory to build in, kept afterwards (default: temporary)')
+    parser.add_argument('--out',default='bench_parse.json',metavar='FILE',help='report file (default bench_parse.json)')
+    args = parser.parse_args(argv)
+
+    if not 2 <= args.pieces <= 8:
+        parser.error('--pieces must be between 2 and 8')
+    if args.jurors < parse_adjforms.numrequired:
+        parser.error('--jurors must be at least '+str(parse_adjforms.numrequired))
+
+    outfile = os.path.abspath(args.out)
+    cwd = os.getcwd()
+
+    if args.workdir:
+        workdir = os.path.abspath(args.workdir)
+        os.makedirs(workdir,exist_ok=True)
+    else:
+        workdir = tempfile.mkdtemp(prefix='bench_parse_')
+
+    try:
+        stages,mismatches = run_benchmark(args.candidates,args.pieces,args.jurors,args.jobs,workdir,args.seed)
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir)
+
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        maxrss = maxrss // 1024
+
+    report = {'benchmark':'parse_adjforms',
+              'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python':platform.python_version(),
+              'platform':platform.platform(),
+              'cpus':os.cpu_count(),
+              'params':{'candidates':args.candidates,'pieces':args.pieces,'jurors':args.jurors,
+                        'jobs':args.jobs,'seed':args.seed},
+              'stages':stages,
+              'peak_rss_kb':maxrss,
+              'mismatches':len(mismatches),
+              'mismatch_details':mismatches}
+
+    with open(outfile,'w') as fh:
+        json.dump(report,fh,indent=4)
+
+    for stage in stages:
+        print('%-18s %8.3f s wall  %8.3f s cpu  %8.2f ms/%s' % (stage['stage'],stage['wall_s'],stage['cpu_s'],
+                                                             stage['ms_per_item'] or 0,stage['unit'].rstrip('s')))
+    print('peak RSS '+str(maxrss)+' kB')
+    for mismatch in mismatches:
+        print('MISMATCH '+mismatch)
+    print(str(len(mismatches))+' mismatches with the marks filled in')
+    print('report saved to '+outfile)
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+'''
+Fill blank juror forms the way jurors return them, for testing and benchmarking parse_adjforms.py
+-- adjudication forms: each piece rated by typing an 'x' in the blank, or by highlighting,
+   underlining or striking through 'passing' / 'not passing', or left blank;
+   overall mark typed out, or picked by bolding, striking through or highlighting 'pass' / 'do not pass',
+   or left blank
+-- repertoire piece forms: piece numbers typed in the table, a few left blank
+-- required piece forms: '1'/'2' or 'x' typed in the blanks, or one title underlined, bolded,
+   highlighted or (the other) struck through, or left blank
+-- a few adjudication forms are left out, and some filenames get a capitalized juror name
+The filled forms are saved flat in one directory, as collected for parse_adjforms.py,
+together with returned_truth.json recording every mark that was filled in.
+
+
+USAGE:
+
+$ python3 benchmarks/make_returned_forms.py <directory with juror folders of blank forms> <output directory>
+'''
+
+import argparse
+import glob
+import json
+import os
+import random
+
+from docx import Document
+from docx.enum.text import WD_COLOR_INDEX
+
+
+def mark_rating(par,grade,how):
+
+    # mark pass (grade 1) or fail (grade -1) on a 'Candidate ... Rating:' line of an adjudication form
+
+    runs = par.runs
+    texts = [run.text for run in runs]
+    ip = texts.index('passing')
+    inp = texts.index('not passing')
+
+    if how == 'text':
+        if grade == 1:
+            runs[texts.index('__ ')].text = 'x '
+        else:
+            blanks = [ind for ind in range(ip,inp) if runs[ind].text == '_']
+            runs[blanks[0]].text = 'x'
+            runs[blanks[1]].text = ''
+    elif how == 'highlight':
+        (runs[ip] if grade == 1 else runs[inp]).font.highlight_color = WD_COLOR_INDEX.YELLOW
+    elif how == 'underline':
+        (runs[ip] if grade == 1 else runs[inp]).font.underline = True
+    elif how == 'strike':
+        (runs[inp] if grade == 1 else runs[ip]).font.strike = True
+
+
+def mark_overall(par,grade,how):
+
+    # mark overall pass (grade 1) or fail (grade -1) on the overall line of an adjudication form
+
+    if how == 'blank':
+        return
+
+    if how == 'text':
+        par.runs[0].text = 'I pass this candidate.' if grade == 1 else 'I do not pass this candidate.'
+        return
+
+    par.runs[0].text = 'I '
+    newruns = [par.add_run(text) for text in ['pass',' / ','do not pass',' this candidate.']]
+    picked = newruns[0] if grade == 1 else newruns[2]
+    other = newruns[2] if grade == 1 else newruns[0]
+
+    if how == 'bold':
+        picked.font.bold = True
+    elif how == 'strike':
+        other.font.strike = True
+    elif how == 'highlight':
+        picked.font.highlight_color = WD_COLOR_INDEX.YELLOW
+
+
+def fill_adjform(filename,r):
+
+    # fill one adjudication form; returns filled Document and its truth record
+
+    form = Document(filename)
+
+    grades = []
+    for par in form.paragraphs:
+        if par.text[:9] == 'Candidate':
+            how = r.choice(['text','text','highlight','underline','strike','blank'])
+            grade = 0 if how == 'blank' else r.choice([1,1,1,-1])
+            if grade:
+                mark_rating(par,grade,how)
+            grades.append(grade)
+
+    cell = form.tables[0].rows[1].cells[1]
+    par = cell.paragraphs[1] if len(cell.paragraphs) > 1 else cell.paragraphs[0]
+    how = r.choice(['text','text','bold','strike','highlight','blank'])
+    grade = r.choice([1,1,-1])
+    mark_overall(par,grade,how)
+
+    overall = '' if how == 'blank' else {1:'pass',-1:'fail'}[grade]
+
+    return form,{'grades':grades,'overall':overall}
+
+
+def fill_repform(filename,r):
+
+    # fill one repertoire piece form; returns filled Document and truth {candidate:[1st,2nd,3rd choice]}
+
+    form = Document(filename)
+
+    votes = {}
+    for row in form.tables[0].rows[1:]:
+        cells = row.cells
+        if cells[0].text:
+            choices = []
+            for cell in cells[1:4]:
+                if r.random() < 0.95:
+                    choice = str(r.randint(1,5))
+                    cell.paragraphs[0].add_run(choice)
+                else:
+                    choice = ''
+                choices.append(choice)
+            if any(choices):
+                votes[cells[0].text] = choices
+
+    return form,votes
+
+
+def fill_reqform(filename,r):
+
+    # fill one required piece form; returns filled Document and truth {candidate:'tech', 'exp' or ''}
+
+    form = Document(filename)
+    paragraphs = form.paragraphs
+
+    votes = {}
+    for ind,par in enumerate(paragraphs):
+        if 'Candidate' in par.text:
+            nextpar = paragraphs[ind+1]
+            cand = par.text.split('\t')[0].split()[-1]
+            how = r.choice(['12','x','underline','bold','strike','highlight','blank'])
+            tech = r.random() < 0.5
+
+            techblank = [run for run in par.runs if '_' in run.text]
+            expblank = [run for run in nextpar.runs if '_' in run.text]
+
+            if how == '12':
+                techblank[-1].text = techblank[-1].text.replace('_____','1' if tech else '2').replace('__','1' if tech else '2',1)
+                expblank[-1].text = expblank[-1].text.replace('_____','2' if tech else '1')
+            elif how == 'x':
+                blank = (techblank if tech else expblank)[-1]
+                blank.text = blank.text.replace('_____','x').replace('__','x',1)
+            elif how != 'blank':
+                techtitle = par.text.split('\t')[1]
+                exptitle = nextpar.text.split('\t')[1]
+                techruns = [run for run in par.runs if run.text == techtitle]
+                expruns = [run for run in nextpar.runs if run.text == exptitle]
+                # strike through the title not picked, mark the one picked otherwise
+                target = techruns if tech != (how == 'strike') else expruns
+                for run in target:
+                    if how == 'underline':
+                        run.font.underline = True
+                    elif how == 'bold':
+                        run.font.bold = True
+                    elif how == 'strike':
+                        run.font.strike = True
+                    elif how == 'highlight':
+                        run.font.highlight_color = WD_COLOR_INDEX.YELLOW
+
+            votes[cand] = '' if how == 'blank' else ('tech' if tech else 'exp')
+
+    return form,votes
+
+
+def make_returned_forms(srcdir,dstdir,seed=0,missing=0.04,recase=0.2):
+
+    # fill all juror forms in the juror folders of srcdir, saving them flat in dstdir
+    # each adjudication form is left out with probability missing, and its juror name is
+    #    capitalized in the filename with probability recase
+    # returns truth dictionary, also saved as dstdir/returned_truth.json:
+    #    {'adjudication':{filename:{'juror','candidate','grades','overall'}},
+    #     'repertoire':{juror:{candidate:[1st,2nd,3rd choice]}}, 'required':{juror:{candidate:vote}}}
+
+    r = random.Random(seed)
+    os.makedirs(dstdir,exist_ok=True)
+    truth = {'adjudication':{},'repertoire':{},'required':{}}
+
+    for filename in sorted(glob.glob(os.path.join(srcdir,'*','*candidate*.docx'))):
+        juror = os.path.basename(os.path.dirname(filename))
+        name = os.path.basename(filename)
+        if r.random() < missing:
+            continue
+        form,record = fill_adjform(filename,r)
+        if r.random() < recase:
+            name = name.replace(juror,juror.capitalize())
+        form.save(os.path.join(dstdir,name))
+        record['juror'] = juror
+        record['candidate'] = name.split('candidate')[1].split('_')[0]
+        truth['adjudication'][name] = record
+
+    for filename in sorted(glob.glob(os.path.join(srcdir,'*','*repertoirepieceform*.docx'))):
+        juror = os.path.basename(os.path.dirname(filename))
+        form,votes = fill_repform(filename,r)
+        form.save(os.path.join(dstdir,os.path.basename(filename)))
+        truth['repertoire'][juror] = votes
+
+    for filename in sorted(glob.glob(os.path.join(srcdir,'*','*requiredpieceform*.docx'))):
+        juror = os.path.basename(os.path.dirname(filename))
+        form,votes = fill_reqform(filename,r)
+        form.save(os.path.join(dstdir,os.path.basename(filename)))
+        truth['required'][juror] = votes
+
+    with open(os.path.join(dstdir,'returned_truth.json'),'w') as fh:
+        json.dump(truth,fh,indent=1,sort_keys=True)
+
+    return truth
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='fill blank juror forms as jurors return them')
+    parser.add_argument('srcdir',help='directory with juror folders of blank forms, as made by create_adjforms.py')
+    parser.add_argument('dstdir',help='directory for the filled forms and returned_truth.json')
+    parser.add_argument('--seed',type=int,default=0,help='random seed (default 0)')
+    parser.add_argument('--missing',type=float,default=0.04,metavar='RATE',
+                        help='share of adjudication forms left out (default 0.04)')
+    args = parser.parse_args(argv)
+
+    truth = make_returned_forms(args.srcdir,args.dstdir,args.seed,args.missing)
+    print(str(len(truth['adjudication']))+' adjudication forms, '+str(len(truth['repertoire']))+' repertoire and '
+          +str(len(truth['required']))+' required piece forms filled in '+args.dstdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -17,6 +17,28 @@ Make that directory the current working directory.
 
 $ python3 create_adjforms.py
 
+To make only some of the forms (any of adj,req,rep,prog):
+
+$ python3 create_adjforms.py --forms adj,prog
+
+To spread the adjudication forms over N worker processes (0 = one per core):
+
+$ python3 create_adjforms.py --jobs N
+
+Reruns only rebuild outputs whose inputs changed (see <examyear>_manifest.json);
+to rebuild everything:
+
+$ python3 create_adjforms.py --force
+
+To report what would be rebuilt without building anything:
+
+$ python3 create_adjforms.py --dry-run
+
+To time each stage and the main helpers (report in <examyear>_create_profile.json),
+optionally with a cProfile dump for pstats:
+
+$ python3 create_adjforms.py --profile --pstats create.pstats
+
 
 THINGS TO BE EDITED EACH YEAR:
 
@@ -26,30 +48,31 @@ THINGS TO BE EDITED EACH YEAR:
 
 
 from __future__ import print_function
-from mailmerge import MailMerge
 from datetime import datetime
-from datetime import date
 
-from docxcompose.composer import Composer
-from docx import Document
+# mailmerge, docx and docxcompose are imported by the helpers that use them,
+#    so importing this module or making only the program listing stays fast
 
-import glob
+import argparse
+import contextlib
+import copy
+import csv
+import hashlib
+import io
+import json
 import math
 import os
-import subprocess
+import re
+import struct
+import sys
+import zlib
+
+import pdflatex_runner
 
 
 #####################
 ##### UTILITIES #####
 
-def delete_paragraph(paragraph):
-
-    # delete paragraph from docx Document
-    
-    p = paragraph._element
-    p.getparent().remove(p)
-    p._p = p._element = None
-
 def delete_row(table,row):
     
     # delete row from table in docx Document
@@ -59,51 +82,622 @@ def delete_row(table,row):
     tbl.remove(tr)
 
 
+# mail merge templates, keyed by template filename: (contents, parsed MailMerge)
+templatecache = {}
+
+def load_template(template):
+
+    # read and parse mail merge template once and keep both for reuse
+    # merge fields are located when the template is parsed, so copies need no further search
+    # returns the template's bytes and the parsed MailMerge, whose own zip is closed once parsed
+
+    if template not in templatecache:
+        from mailmerge import MailMerge
+        with open(template,'rb') as fh:
+            data = fh.read()
+        base = MailMerge(io.BytesIO(data))
+        base.zip.close()
+        templatecache[template] = (data,base)
+
+    return templatecache[template]
+
+
+def copy_template(template):
+
+    # fresh copy of the parsed template, to fill in
+    # the part trees are copied, and each copy opens its own zip over the cached bytes for the members
+    #    written back unchanged, so no zip handle is shared between copies (or with forked workers)
+
+    import zipfile
+
+    data,base = load_template(template)
+    doc = copy.copy(base)
+    doc.zip = zipfile.ZipFile(io.BytesIO(data))
+    doc.parts = {doc.zip.getinfo(zi.filename):copy.deepcopy(part) for zi,part in base.parts.items()}
+    if base.settings is not None:
+        doc._settings_info = doc.zip.getinfo(base._settings_info.filename)
+        doc.settings = copy.deepcopy(base.settings)
+
+    return doc
+
+
+def merge_template(template,fields):
+
+    # fill merge fields in a fresh copy of the parsed template
+
+    doc = copy_template(template)
+    doc.merge(**fields)
+
+    return doc
+
+
+def merged_document(template,fields):
+
+    # merge fields into template and open the result as a docx Document, all in memory
+
+    from docx import Document
+
+    buffer = io.BytesIO()
+    merge_template(template,fields).write(buffer)
+    buffer.seek(0)
+
+    return Document(buffer)
+
+
+def piece_fields(candidate,piece):
+
+    # merge fields of one piece's adjudication form
+
+    piecefields = {
+        'candidate_number': candidate,
+        'piece_name': piece['name'],
+        'composer_name': piece['comp'],
+    }
+    if piece['tech'] or piece['exp']:
+        piecefields['req'] = 'Yes'
+    else:
+        piecefields['req'] = 'No'
+
+    return piecefields
+
+
+def make_adjpacket(candidate,piecelist):
+
+    # combine adjudication forms (1 form per piece) and overall pass/fail page for this candidate
+    # returns the bytes of the finished .docx; nothing is written to disk
+    # with direct_packets, written straight from the templates' XML (see direct_packet) if their layout allows
+
+    if direct_packets:
+        packet = direct_packet(candidate,piecelist)
+        if packet is not None:
+            return packet
+
+    from docxcompose.composer import Composer
+
+    sections = []
+    for piece in piecelist:
+        sections.append(merged_document(template1,piece_fields(candidate,piece)))
+
+    # overall pass/fail page
+    sections.append(merged_document(template2,{'candidate_number': candidate}))
+
+    composer = Composer(sections[0])
+    for section in sections[1:]:
+        composer.append(section)
+
+    packet = io.BytesIO()
+    composer.save(packet)
+
+    return packet.getvalue()
+
+
+# direct packet writer, for templates laid out like adjform_pf.docx and overallform.docx
+# a packet made by docxcompose is the first form's .docx with the bodies of all the merged forms
+#    (less their section properties) in its word/document.xml, and its drawings numbered 1, 2, ... in order
+# so word/document.xml is put together from each template's merged body, serialized and compressed once
+#    with the merge fields left as slots, and only the field values are compressed per packet;
+#    the other members are copied from the template .docx as they are, still compressed
+
+# WordprocessingML, drawing and relationship namespaces, as they prefix tags in word/document.xml
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+WP = '{http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing}'
+R = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+
+# relationships a template may have for the direct writer; anything else (headers, images, ...)
+#    needs docxcompose to combine the forms
+plain_rels = ['styles','settings','webSettings','fontTable','theme']
+
+# merge fields of each template filled in by make_adjpacket
+packet_fields = {'adjform':['candidate_number','piece_name','composer_name','req'],
+                 'overallform':['candidate_number']}
+
+# merged templates with slots for the merge fields, keyed by template filename
+slotcache = {}
+# serialized and compressed form bodies and document frames, keyed by (template, base template, first drawing id)
+chunkcache = {}
+
+
+def slot_text(field):
+
+    # placeholder merged into a field, marking its slot
+
+    return 'MERGESLOT'+field+'MERGESLOT'
+
+
+def deflate_chunk(data):
+
+    # raw deflate data, ending on a full flush so it can be followed by any other such chunk
+
+    compressor = zlib.compressobj(6,zlib.DEFLATED,-15)
+
+    return compressor.compress(data)+compressor.flush(zlib.Z_FULL_FLUSH)
+
+
+def slot_form(template,fields):
+
+    # merge template as merge_template does, with a placeholder in each of fields; parsed once and kept for reuse
+    # returns dictionary with the merged document.xml root, the style ids used in its body and defined in styles.xml,
+    #    and its members as arguments of write_member to copy into packets (with no data for document.xml),
+    #    or None if the template's layout needs docxcompose to combine it with other forms
+
+    if template in slotcache:
+        return slotcache[template]
+
+    import zipfile
+    from lxml import etree
+
+    merged = io.BytesIO()
+    merge_template(template,{field:slot_text(field) for field in fields}).write(merged)
+    mergedzip = zipfile.ZipFile(merged)
+    templatebytes = io.BytesIO(load_template(template)[0])
+    templatezip = zipfile.ZipFile(templatebytes)
+
+    rels = etree.fromstring(mergedzip.read('word/_rels/document.xml.rels'))
+    root = etree.fromstring(mergedzip.read('word/document.xml'))
+    body = root.find(W+'body')
+
+    slotcache[template] = None
+    if root.nsmap.get('w') != W[1:-1] or body is None or not len(body) or body[-1].tag != W+'sectPr':
+        return None
+    if any(rel.get('Type').split('/')[-1] not in plain_rels for rel in rels):
+        return None
+    if any(name.startswith(R) for elem in body.iter() for name in elem.attrib) or body.find('.//'+W+'numPr') is not None:
+        return None
+
+    styles = etree.fromstring(mergedzip.read('word/styles.xml'))
+    used = set(elem.get(W+'val') for tag in ['pStyle','rStyle','tblStyle'] for elem in body.iter(W+tag))
+    defined = set(style.get(W+'styleId') for style in styles.iter(W+'style'))
+
+    # members mailmerge writes back unchanged are copied from the template itself, the others from its output
+    # all keep the template's timestamps, so a packet is the same from one run to the next
+    members = []
+    for info in templatezip.infolist():
+        if info.filename == 'word/document.xml':
+            members.append((info.filename,zlib.DEFLATED,None,None,None,info.date_time))
+        elif templatezip.read(info) == mergedzip.read(info.filename):
+            members.append((info.filename,info.compress_type,info.CRC,raw_member(templatebytes,info),info.file_size,info.date_time))
+        else:
+            mergedinfo = mergedzip.getinfo(info.filename)
+            members.append((info.filename,mergedinfo.compress_type,mergedinfo.CRC,raw_member(merged,mergedinfo),
+                            mergedinfo.file_size,info.date_time))
+
+    slotcache[template] = {'root':root,'used':used,'defined':defined,'members':members}
+
+    return slotcache[template]
+
+
+def raw_member(fh,info):
+
+    # compressed bytes of one member of the zip archive open in fh, as stored
+
+    _ = fh.seek(info.header_offset+26)
+    namelen,extralen = struct.unpack('<HH',fh.read(4))
+    _ = fh.seek(info.header_offset+30+namelen+extralen)
+
+    return fh.read(info.compress_size)
+
+
+def body_chunks(template,fields,base,firstid):
+
+    # body of template's merged form, as it is serialized in a packet built on base, split at its merge fields
+    # drawings are numbered from firstid on
+    # returns (list of (bytes, compressed bytes) for the text between slots, alternating with field names;
+    #    next drawing id)
+
+    key = (template,base,firstid)
+    if key in chunkcache:
+        return chunkcache[key]
+
+    from lxml import etree
+
+    form = slot_form(template,fields)['root']
+    baseroot = slot_form(base,packet_fields['adjform' if base == template1 else 'overallform'])['root']
+
+    host = etree.Element(baseroot.tag,attrib=dict(baseroot.attrib),nsmap=baseroot.nsmap)
+    body = etree.SubElement(host,W+'body')
+    for elem in form.find(W+'body')[:-1]:
+        body.append(copy.deepcopy(elem))
+    nextid = firstid
+    for elem in body.iter(WP+'docPr'):
+        elem.set('id',str(nextid))
+        nextid += 1
+
+    xml = etree.tostring(host)
+    xml = xml[xml.index(b'<w:body>')+len(b'<w:body>'):xml.rindex(b'</w:body>')]
+
+    chunks = []
+    for ind,part in enumerate(re.split(rb'MERGESLOT(\w+)MERGESLOT',xml)):
+        chunks.append((part,deflate_chunk(part)) if ind % 2 == 0 else part.decode())
+
+    chunkcache[key] = (chunks,nextid)
+
+    return chunkcache[key]
+
+
+def frame_chunks(base,fields):
+
+    # word/document.xml of a packet built on base around its body, as (bytes, compressed bytes) before and after it
+    # the section properties of base close the body
+
+    key = (base,None,None)
+    if key in chunkcache:
+        return chunkcache[key]
+
+    from lxml import etree
+
+    root = copy.deepcopy(slot_form(base,fields)['root'])
+    body = root.find(W+'body')
+    for elem in body[:-1]:
+        body.remove(elem)
+    body.text = slot_text('body')
+
+    xml = etree.tostring(root,xml_declaration=True,encoding='UTF-8',standalone=True)
+    head,tail = xml.split(slot_text('body').encode())
+
+    chunkcache[key] = ((head,deflate_chunk(head)),(tail,deflate_chunk(tail)))
+
+    return chunkcache[key]
+
+
+def field_xml(text):
+
+    # merge field text as mailmerge puts it in place of a placeholder: escaped, with line breaks as <w:br/>
+
+    text = text or ''
+    if re.search('[\x00-\x08\x0b\x0c\x0e-\x1f]',text):
+        raise ValueError('All strings must be XML compatible: '+repr(text))
+
+    lines = text.replace('\r','').split('\n')
+    lines = [line.replace('&','&amp;').replace('<','&lt;').replace('>','&gt;') for line in lines]
+
+    return '</w:t><w:br/><w:t>'.join(lines).encode('utf-8')
+
+
+def direct_packet(candidate,piecelist):
+
+    # packet as make_adjpacket builds it with docxcompose, written straight from the templates' XML
+    # returns the bytes of the finished .docx, or None if the templates' layout needs docxcompose
+
+    sections = [(template1,packet_fields['adjform'],piece_fields(candidate,piece)) for piece in piecelist]
+    sections.append((template2,packet_fields['overallform'],{'candidate_number':candidate}))
+    base,basefields,_ = sections[0]
+
+    forms = [slot_form(template,fields) for template,fields,values in sections]
+    if any(form is None for form in forms) or any(not form['used'] <= forms[0]['defined'] for form in forms):
+        return None
+
+    head,tail = frame_chunks(base,basefields)
+    parts = [head]
+    nextid = 1
+    for template,fields,values in sections:
+        chunks,nextid = body_chunks(template,fields,base,nextid)
+        for chunk in chunks:
+            if isinstance(chunk,str):
+                text = field_xml(values.get(chunk,''))
+                parts.append((text,deflate_chunk(text)))
+            else:
+                parts.append(chunk)
+    parts.append(tail)
+
+    crc = 0
+    size = 0
+    for text,_ in parts:
+        crc = zlib.crc32(text,crc)
+        size += len(text)
+    document = b''.join(deflated for _,deflated in parts)+zlib.compressobj(6,zlib.DEFLATED,-15).flush()
+
+    members = []
+    for name,method,membercrc,data,membersize,date_time in forms[0]['members']:
+        if data is None:
+            members.append((name,method,crc,document,size,date_time))
+        else:
+            members.append((name,method,membercrc,data,membersize,date_time))
+
+    return write_zip(members)
+
+
+def write_zip(members):
+
+    # zip archive of members (name, compression method, crc, compressed bytes, size, date_time),
+    #    stored as given without compressing them again
+
+    out = io.BytesIO()
+    central = []
+    for member in members:
+        central.append(write_member(out,*member))
+    write_central(out,central)
+
+    return out.getvalue()
+
+
+def write_member(fh,name,method,crc,data,size,date_time):
+
+    # write one zip member, already compressed, at the current position of fh
+    # returns its central directory record, for write_central
+
+    encoded = name.encode('utf-8')
+    flags = 0x800 if not name.isascii() else 0
+    dostime = date_time[3] << 11 | date_time[4] << 5 | date_time[5] // 2
+    dosdate = (date_time[0]-1980) << 9 | date_time[1] << 5 | date_time[2]
+    fields = (20,flags,method,dostime,dosdate,crc,len(data),size,len(encoded))
+
+    record = struct.pack('<4s2H4H3L5H2L',b'PK\x01\x02',20,*fields,0,0,0,0,0,fh.tell())+encoded
+    _ = fh.write(struct.pack('<4s5H3L2H',b'PK\x03\x04',*fields,0)+encoded)
+    _ = fh.write(data)
+
+    return record
+
+
+def write_central(fh,central):
+
+    # write the central directory (records from write_member) and end record, finishing a zip archive in fh
+
+    start = fh.tell()
+    for record in central:
+        _ = fh.write(record)
+    _ = fh.write(struct.pack('<4s4H2LH',b'PK\x05\x06',0,0,len(central),len(central),fh.tell()-start,start,0))
+
+
+# juror bundles being written with fanout = 'bundle', keyed by juror folder:
+#    {'path':..., 'fh': open temporary file, 'central': central directory records, 'names': member names, 'date_time':...}
+bundles = {}
+# members of the bundles from the last run, keyed by juror folder
+oldbundles = {}
+
+def bundle_path(folder):
+
+    # archive holding all of a juror's forms, in place of the juror folder
+
+    return examyear+'_forms_'+os.path.basename(folder)+'.zip'
+
+
+def old_bundle(folder):
+
+    # {member name : ZipInfo} of a juror's bundle as the last run left it; empty if there is none
+
+    if folder not in oldbundles:
+        import zipfile
+        try:
+            with zipfile.ZipFile(bundle_path(folder)) as zf:
+                oldbundles[folder] = {info.filename:info for info in zf.infolist()}
+        except (OSError,zipfile.BadZipFile):
+            oldbundles[folder] = {}
+
+    return oldbundles[folder]
+
+
+def output_exists(path):
+
+    # True if an output file is there: in its juror folder, or in the juror's bundle with fanout = 'bundle'
+
+    folder = os.path.dirname(path)
+    if fanout == 'bundle' and folder:
+        return path.replace(os.sep,'/') in old_bundle(folder)
+
+    return os.path.exists(path)
+
+
+def bundle_member(path,data,crc):
+
+    # stream one form into its juror's bundle, stored as it is (the .docx is compressed already)
+    # the bundle is started under a temporary name on its first form, and finished by close_bundles
+
+    folder = os.path.dirname(path)
+    if folder not in bundles:
+        bundlefile = bundle_path(folder)
+        bundles[folder] = {'path':bundlefile,'fh':open(bundlefile+'.part','wb'),'central':[],'names':set(),
+                           'date_time':datetime.now().timetuple()[:6]}
+    bundle = bundles[folder]
+
+    name = path.replace(os.sep,'/')
+    bundle['central'].append(write_member(bundle['fh'],name,0,crc,data,len(data),bundle['date_time']))
+    bundle['names'].add(name)
+
+
+def close_bundles():
+
+    # finish the juror bundles written in this run and put them in place of the old ones
+    # forms skipped as unchanged are copied over from the old bundle, still compressed
+
+    for folder,bundle in bundles.items():
+        fh = bundle['fh']
+        kept = [info for name,info in old_bundle(folder).items() if name not in bundle['names']]
+        if kept:
+            with open(bundle['path'],'rb') as oldfh:
+                for info in kept:
+                    bundle['central'].append(write_member(fh,info.filename,info.compress_type,info.CRC,
+                                                          raw_member(oldfh,info),info.file_size,info.date_time))
+        write_central(fh,bundle['central'])
+        fh.close()
+        os.replace(bundle['path']+'.part',bundle['path'])
+
+    bundles.clear()
+    oldbundles.clear()
+
+
+# ioctl request number for cloning a file on linux (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+def reflink(src,dst):
+
+    # make dst a copy-on-write clone of src; returns False if the filesystem can't do it
+
+    try:
+        import fcntl
+    except ImportError:
+        return False
+
+    with open(src,'rb') as fsrc, open(dst,'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(),FICLONE,fsrc.fileno())
+        except OSError:
+            return False
+
+    return True
+
+
+def fan_out(data,paths,mode='copy'):
+
+    # place one serialized file at every path in paths, creating folders as needed
+    # 'copy' writes the bytes at each path
+    # 'hardlink'/'reflink' write the first path and link/clone the rest to it,
+    #    falling back to a plain copy where the filesystem doesn't support that
+    # 'bundle' streams the bytes into the bundle of each path's folder instead (see bundle_member);
+    #    they are checksummed once and written as they are into every bundle
+
+    if mode == 'bundle':
+        crc = zlib.crc32(data)
+        for path in paths:
+            bundle_member(path,data,crc)
+        return
+
+    first = ''
+    for path in paths:
+
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.mkdir(folder)
+
+        # build under a temporary name so an existing (possibly linked) file is replaced, not overwritten
+        tmppath = path+'.tmp'
+        if os.path.lexists(tmppath):
+            os.remove(tmppath)
+
+        placed = False
+        if first and mode == 'hardlink':
+            try:
+                os.link(first,tmppath)
+                placed = True
+            except OSError:
+                placed = False
+        elif first and mode == 'reflink':
+            placed = reflink(first,tmppath)
+
+        if not placed:
+            with open(tmppath,'wb') as fh:
+                _ = fh.write(data)
+
+        os.replace(tmppath,path)
+
+        if not first:
+            first = path
+
+
+def file_digest(filename):
+
+    # sha256 of a file's contents
+
+    with open(filename,'rb') as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
+
+
+def inputs_digest(*inputs):
+
+    # sha256 of json-serializable inputs, independent of dictionary order
+
+    return hashlib.sha256(json.dumps(inputs,sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def load_manifest(manifestfile):
+
+    # read manifest of input digests from the last run; empty if there is none
+
+    try:
+        with open(manifestfile,'r') as fh:
+            return json.load(fh)
+    except (OSError,ValueError):
+        return {}
+
+
+def up_to_date(manifest,name,digest,outputs):
+
+    # True if the last run built this output from the same inputs and all its files still exist
+
+    return manifest.get(name) == digest and all(output_exists(x) for x in outputs)
+
+
 def tsv_to_piecedict(tsvfile):
 
     # convert .tsv of google form responses to dictionary for juror form generation
+    # tsvfile is a filename, '-' for standard input, or an open file
+    # rows are streamed through the csv reader (so quoted tabs/newlines in titles are kept),
+    #    and only the latest submission for each candidate is held
+
+    if tsvfile == '-':
+        return tsv_to_piecedict(io.TextIOWrapper(sys.stdin.buffer,newline=''))
+    elif isinstance(tsvfile,str):
+        with open(tsvfile,'r',newline='') as fh:
+            return tsv_to_piecedict(fh)
+
+    # index of latest program info by candidate number; later rows replace earlier ones
+    latest = {}
+    
+    reader = csv.reader(tsvfile,delimiter='\t')
+    _ = next(reader,None)
+
+    for line in reader:
 
-    with open(tsvfile,'r') as fh:
-        tsv = fh.readlines()
+        # short programs are padded with empty fields in the export; drop them
+        while line and not line[-1].strip():
+            line.pop()
+        if len(line) < 2:
+            continue
+        line[0] = line[0].lstrip()
+        line[-1] = line[-1].rstrip()
+
+        latest[line[1]] = line[2:]
 
     piecedict = {}
         
-    if len(tsv) < 2:
+    if not latest:
         print('no entries in .tsv?')
 
-    else:
-        
-        entries = [line.strip().split('\t') for line in tsv[1:] if line.strip()]
-        candnums = list(set([line[1] for line in entries]))
-
-        for num in candnums:
-            thisprog = []
-            techflag = 0
-            expflag = 0
-            programinfo = [line for line in entries if line[1] == num][-1][2:]
-
-            for ind in range(math.floor(len(programinfo)/3)):
-                thispiece = {'name':programinfo[3*ind],'comp':programinfo[3*ind+1]}
-
-                if programinfo[3*ind+2] == 'Technical':
-                    thispiece['tech'] = True
-                    thispiece['exp'] = False
-                    techflag += 1
-                elif programinfo[3*ind+2] == 'Expressive':
-                    thispiece['tech'] = False
-                    thispiece['exp'] = True
-                    expflag += 1
-                else:
-                    thispiece['tech'] = False
-                    thispiece['exp'] = False
-
-                thisprog.append(thispiece)
-
-            if techflag*expflag != 1:
-                print('candidate '+num+' has wrong number of required pieces')
-                    
-            piecedict[num] = thisprog
+    for num,programinfo in latest.items():
+        thisprog = []
+        techflag = 0
+        expflag = 0
+
+        for ind in range(math.floor(len(programinfo)/3)):
+            thispiece = {'name':programinfo[3*ind],'comp':programinfo[3*ind+1]}
+
+            if programinfo[3*ind+2] == 'Technical':
+                thispiece['tech'] = True
+                thispiece['exp'] = False
+                techflag += 1
+            elif programinfo[3*ind+2] == 'Expressive':
+                thispiece['tech'] = False
+                thispiece['exp'] = True
+                expflag += 1
+            else:
+                thispiece['tech'] = False
+                thispiece['exp'] = False
+
+            thisprog.append(thispiece)
+
+        if techflag*expflag != 1:
+            print('candidate '+num+' has wrong number of required pieces')
                     
+        piecedict[num] = thisprog
                     
     return piecedict
     
@@ -120,7 +714,6 @@ template4 = 'repertoirepieceform.docx'
 
 # file with responses from program listing form 
 tsvfile = '2022 GCNA Carillonneur Exam Recording Program (Responses) - Form Responses 1.tsv' ### !!!CHANGE THIS!!!
-piecedict = tsv_to_piecedict(tsvfile)
 
 # year-specific data:
 
@@ -132,8 +725,6 @@ examyear = '2022'
 # all jurors in committee
 jurors = ['hunsberger','lee','lehrer','lens','lukyanova','macoska','tam'] 
 
-candidates = sorted(list(piecedict.keys()),key=int)
-
 ### !!!CHANGE THIS!!!
 # enforce consistent piece titles in the required piece form
 # pick a word likely to appear in any description of this piece,
@@ -147,6 +738,18 @@ req_piece_std_format = {
     'valse': 'Valse Romantique',
     'braes': "Ye Banks and Braes"}
 
+# write adjudication packets straight from the templates' XML (True), or always through
+#    mailmerge, docx and docxcompose (False); templates with headers, images or numbering
+#    are always combined by docxcompose
+direct_packets = True
+
+# how the copies of each form are placed in the juror folders:
+# 'copy' (separate files), 'hardlink' (one file, linked into each folder)
+#    or 'reflink' (copy-on-write clones, where the filesystem supports it)
+# or 'bundle' to write each juror's forms straight into one archive <examyear>_forms_<juror>.zip
+#    (ready to send out) instead of a folder
+fanout = 'copy'
+
 
 #############################
 ##### FORMS TO GENERATE #####
@@ -159,19 +762,19 @@ req_piece_std_format = {
 forms_to_make = ['rep','req','adj','prog']
     
 
-##############################
-##### ADJUDICATION FORMS #####
+#######################
+##### FORM STAGES #####
+
+def get_reqpiecedict(candidates,piecedict):
+
+    # setup dictionary of all candidates' required pieces for use in required piece form
 
-if 'req' in forms_to_make:
     reqpiecedict = {'exam_year':examyear}
 
-for candidate in candidates:
+    for candidate in candidates:
+
+        piecelist = piecedict[candidate]
 
-    piecelist = piecedict[candidate]
-    
-    if 'req' in forms_to_make:
-        
-        # setup dictionary of all candidates' required pieces for use in required piece form    
         try:
             tech = [x['name'] for x in piecelist if x['tech'] == True][0]
             exp = [x['name'] for x in piecelist if x['exp'] == True][0]
@@ -188,137 +791,159 @@ for candidate in candidates:
         reqpiecedict['tech'+candidate] = tech
         reqpiecedict['exp'+candidate] = exp
 
-        
-    if 'adj' in forms_to_make:
-    
-        # create adjudication forms (1 form per piece) for this candidate  
-        for ind in range(len(piecelist)):
-
-            piece = piecelist[ind]
-            piecefields = {
-                'candidate_number': candidate,
-                'piece_name': piece['name'],
-                'composer_name': piece['comp'],
-            }
-            if piece['tech'] or piece['exp']:
-                piecefields['req'] = 'Yes'
-            else:
-                piecefields['req'] = 'No'
+    return reqpiecedict
 
-            doc = MailMerge(template1)
-            doc.merge(**piecefields)
-            doc.write(examyear+'_'+candidate+str(ind+1)+'.docx')
 
-        # create overall pass/fail page
-        overall = {'candidate_number': candidate}
-    
-        enddoc = MailMerge(template2)
-        enddoc.merge(**overall)
-        enddoc.write(examyear+'_'+candidate+'end.docx')
+def adjform_paths(candidate):
 
-        # combine all adjudication forms and overall pass/fail page
-        master = Document(examyear+'_'+candidate+'1.docx')
-        composer = Composer(master)
+    # juror copies of this candidate's adjudication forms
 
-        for ind in range(len(piecelist)-1):
-            section = Document(examyear+'_'+candidate+str(ind+2)+'.docx')
-            composer.append(section)
-        
-        endsection = Document(examyear+'_'+candidate+'end.docx')
-        composer.append(endsection)
+    return [os.path.join(juror,examyear+'_candidate'+candidate+'_'+juror+'.docx') for juror in jurors]
 
-        # save one copy for each juror
-        for juror in jurors:
 
-            thisadjfile = examyear+'_candidate'+candidate+'_'+juror+'.docx'
-            composer.save(thisadjfile)
+def reqform_paths():
 
-            if not os.path.exists(juror):
-                os.mkdir(juror)
+    # juror copies of the required piece form
 
-            os.replace(thisadjfile,os.path.join(juror,thisadjfile))
+    return [os.path.join(juror,examyear+'_requiredpieceform_'+juror+'.docx') for juror in jurors]
 
-        for adjfile in glob.glob(examyear+'_'+candidate+'*.docx'):
-            os.remove(adjfile)
 
-        
-###############################
-##### REQUIRED PIECE FORM #####
+def repform_paths():
 
-if 'req' in forms_to_make:
+    # juror copies of the repertoire piece form
 
-    # create required piece form        
-    reqpiecedoc = MailMerge(template3)
-    reqpiecedoc.merge(**reqpiecedict)
-    reqpiecedoc.write(examyear+'_reqpieceform.docx')
+    return [os.path.join(juror,examyear+'_repertoirepieceform_'+juror+'.docx') for juror in jurors]
 
-    # delete fields for nonexistent candidates
-    reqpieceform = Document(examyear+'_reqpieceform.docx')
-    delcounter = 0
-    for paragraph in reqpieceform.paragraphs:
-        if delcounter > 0:
-            delete_paragraph(paragraph)
-            delcounter = delcounter-1
+
+def progform_paths():
+
+    # program listing .tex and the pdf made from it
+
+    progfile = examyear+'_candidate_programs.tex'
+
+    return [progfile,progfile.replace('.tex','.pdf')]
+
+
+def make_adjforms(candidates,piecedict,jobs=1):
+
+    # create combined adjudication forms for each candidate, spread over a process pool if jobs > 1
+
+    piecelists = [piecedict[candidate] for candidate in candidates]
+
+    if jobs > 1 and len(candidates) > 1:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # workers come from a fork server rather than a fork of this process, whose pdflatex thread
+        #    (started by make_progfile) may be running; spawned where there is no fork server
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
         else:
-            candnum = paragraph.text.split('\t')[0]
-            if 'Candidate' in candnum and candnum[-2:].strip().isnumeric() and candnum[-2:].strip() not in candidates:
-                delete_paragraph(paragraph)
-                delcounter = 2
+            context = multiprocessing.get_context('spawn')
+        pooled = ProcessPoolExecutor(max_workers=jobs,mp_context=context)
+    else:
+        pooled = contextlib.nullcontext()
 
-    # save one copy per juror
-    for juror in jurors:
+    with pooled as pool:
+        packets = (pool.map if pool else map)(make_adjpacket,candidates,piecelists)
 
-        reqfile = examyear+'_requiredpieceform_'+juror+'.docx'
-        reqpieceform.save(reqfile)
+        # save one copy for each juror; packets come back in candidate order
+        for candidate,packet in zip(candidates,packets):
+            fan_out(packet,adjform_paths(candidate),fanout)
 
-        if not os.path.exists(juror):
-            os.mkdir(juror)
 
-        os.replace(reqfile,os.path.join(juror,reqfile))
+def candidate_lines(body,candidates):
 
-    os.remove(examyear+'_reqpieceform.docx')
-        
+    # replace the candidate lines in the body of the required piece form with a pair of lines for each candidate
+    # the template's first 'tech<N>' line and the 'exp<N>' line after it are copied for each candidate,
+    #    with the paragraphs between them and the next 'tech<N>' line as separator
+    # returns False if the body has no candidate lines
+
+    slot = re.compile(r'(tech|exp)(\d+)$')
+
+    # merge field slots in the template: (index of paragraph, 'tech' or 'exp', candidate number in template)
+    slots = []
+    for ind,elem in enumerate(body):
+        for field in elem.iter('MergeField'):
+            match = slot.match(field.get('name'))
+            if match:
+                slots.append((ind,match.group(1),match.group(2)))
+                break
+
+    techind = [ind for ind,(_,kind,_) in enumerate(slots) if kind == 'tech']
+    if not techind or techind[0]+1 >= len(slots) or slots[techind[0]+1][1] != 'exp':
+        return False
 
-#################################
-##### REPERTOIRE PIECE FORM #####
+    first,_,protonum = slots[techind[0]]
+    expline = slots[techind[0]+1][0]
+    prototype = [body[first],body[expline]]
+    separator = list(body[expline+1:slots[techind[1]][0]]) if len(techind) > 1 else []
+    label = re.compile(r'\b'+protonum+r'\b')
+
+    lines = []
+    for candidate in candidates:
+        if lines:
+            lines += [copy.deepcopy(elem) for elem in separator]
+        for elem in prototype:
+            elem = copy.deepcopy(elem)
+            for field in elem.iter('MergeField'):
+                match = slot.match(field.get('name'))
+                if match:
+                    field.set('name',match.group(1)+candidate)
+            for text in elem.iterfind(W+'r/'+W+'t'):
+                if text.text and 'Candidate' in text.text:
+                    text.text = label.sub(candidate,text.text)
+            lines.append(elem)
+
+    body[first:slots[-1][0]+1] = lines
+
+    return True
+
+
+def make_reqform(candidates,reqpiecedict):
+
+    # create required piece form, one copy per juror
+    # the candidate lines are made for exactly these candidates before the form is merged (see candidate_lines)
+
+    reqpieceform = copy_template(template3)
+    found = False
+    for part in reqpieceform.parts.values():
+        body = part.getroot().find(W+'body')
+        if body is not None:
+            found = candidate_lines(body,candidates) or found
+    if not found:
+        print('no candidate lines (tech<N>, exp<N> merge fields) in '+template3)
+    reqpieceform.merge(**reqpiecedict)
+
+    # save one copy per juror
+    reqbytes = io.BytesIO()
+    reqpieceform.write(reqbytes)
+    fan_out(reqbytes.getvalue(),reqform_paths(),fanout)
 
-if 'rep' in forms_to_make:
+
+def make_repform(candidates):
+
+    # create repertoire piece form, one copy per juror
 
     # setup dictionary of required pieces
     repertoiredict = {'exam_year':examyear}
     for ind in range(len(candidates)):
         repertoiredict['candnum'+str(ind+1)] = candidates[ind]
 
-    # create repertoire piece form
-    repertoiredoc = MailMerge(template4)
-    repertoiredoc.merge(**repertoiredict)
-    repertoiredoc.write(examyear+'_reppieceform.docx')
+    repertoireform = merged_document(template4,repertoiredict)
 
     # delete fields for nonexistent candidates
-    repertoireform = Document(examyear+'_reppieceform.docx')
     piecetable = repertoireform.tables[0]
     for row in piecetable.rows:
         if not row.cells[0].text:
             delete_row(piecetable,row)
 
     # save one copy per juror
-    for juror in jurors:
-
-        repfile = examyear+'_repertoirepieceform_'+juror+'.docx'
-        repertoireform.save(repfile)
+    repbytes = io.BytesIO()
+    repertoireform.save(repbytes)
+    fan_out(repbytes.getvalue(),repform_paths(),fanout)
 
-        if not os.path.exists(juror):
-            os.mkdir(juror)
 
-        os.replace(repfile,os.path.join(juror,repfile))
-        
-    os.remove(examyear+'_reppieceform.docx')
-    
-
-############################
-##### PROGRAMS LISTING #####
-
-if 'prog' in forms_to_make:
+def make_progfile(candidates,piecedict):
 
     # create LaTeX file with candidate programs; start with LaTeX front matter
     preamble = [
@@ -349,7 +974,7 @@ if 'prog' in forms_to_make:
 
     # index for individual program listings
     pieceindex = 'abcdefgh'
-    
+
     for candidate in candidates:
 
         # create tabular env for each candidate's program
@@ -361,28 +986,179 @@ if 'prog' in forms_to_make:
             piecestr = '& ' + pieceindex[piececount]+')& ' + piece['name']+'& ' + piece['comp']+'& '
             if piececount == 0:
                 piecestr = '{\\bf Candidate '+candidate+'}' + piecestr
-                
+            
             if piece['tech']:
                 piecestr += '(T)\\\\\n'
             elif piece['exp']:
                 piecestr += '(E)\\\\\n'
             else:
                 piecestr += '\\\\\n'
-                
+            
             thisproglist.append(piecestr)
             piececount += 1
 
         thisproglist.append('\\end{tabular}\\medskip\n\n')
-        
+    
         proglines += thisproglist
 
     proglines += ['\\end{document}\n']
 
-    # save .tex and run pdflatex
-    progfile = examyear+'_candidate_programs.tex'
+    # save .tex and start pdflatex in the background (skipped if the .tex is unchanged)
+    progfile = progform_paths()[0]
     with open(progfile,'w') as fh:
         for line in proglines:
             _ = fh.write(line)
 
-    subprocess.run('pdflatex '+progfile+' > pdflatex.log 2>&1',shell=True)
-    
+    return pdflatex_runner.run_pdflatex(progfile,'pdflatex.log')
+
+
+#######################
+##### MAIN MODULE #####
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='create recording stage adjudication forms')
+    parser.add_argument('--tsv',default=tsvfile,metavar='FILE',
+                        help="form responses .tsv ('-' reads standard input; default: tsvfile parameter)")
+    parser.add_argument('--forms',default=','.join(forms_to_make),metavar='LIST',
+                        help='comma-separated forms to make out of adj,req,rep,prog (default: forms_to_make)')
+    parser.add_argument('--jobs',type=int,default=1,metavar='N',
+                        help='worker processes for adjudication forms (0 = one per core, default 1)')
+    parser.add_argument('--bundle',action='store_true',
+                        help="write each juror's forms into <examyear>_forms_<juror>.zip instead of a folder (fanout = 'bundle')")
+    parser.add_argument('--force',action='store_true',
+                        help='rebuild all outputs, even those unchanged since the last run')
+    parser.add_argument('--dry-run',action='store_true',
+                        help='only report which outputs would be rebuilt')
+    parser.add_argument('--profile',action='store_true',
+                        help='time stages and hot helpers, report in <examyear>_create_profile.json')
+    parser.add_argument('--pstats',default='',metavar='FILE',
+                        help='with --profile, also save a cProfile dump of the run to FILE')
+    args = parser.parse_args(argv)
+
+    forms = [x.strip() for x in args.forms.split(',') if x.strip()]
+    unknown = [x for x in forms if x not in ['adj','req','rep','prog']]
+    if unknown:
+        parser.error('unknown form(s) '+', '.join(unknown))
+
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+
+    global fanout
+    if args.bundle:
+        fanout = 'bundle'
+
+    if not (args.profile or args.pstats):
+        make_forms(args,forms,jobs)
+        return
+
+    start_profiling(args.pstats)
+    try:
+        make_forms(args,forms,jobs)
+    finally:
+        import profiling
+        profiling.finish(examyear+'_create_profile.json','create_adjforms',
+                         {'forms':forms,'jobs':jobs,'force':args.force,'dry_run':args.dry_run,'fanout':fanout})
+
+
+def start_profiling(pstats=''):
+
+    # time form stages and hot helpers for --profile (see profiling.py)
+    # with --jobs, helpers run in worker processes aren't counted
+
+    import profiling
+    import docx
+    import mailmerge
+    import docxcompose.composer
+
+    profiling.start(pstats)
+    profiling.instrument(globals(),['tsv_to_piecedict','make_progfile','make_adjforms','make_reqform','make_repform'],'stage')
+    profiling.instrument(globals(),['load_template','copy_template','merge_template','merged_document','make_adjpacket','direct_packet','write_zip','fan_out','close_bundles'])
+    profiling.instrument(mailmerge.MailMerge,['merge','write'],prefix='MailMerge.')
+    profiling.instrument(docx,['Document'],prefix='docx.')
+    profiling.instrument(docxcompose.composer.Composer,['append','save'],prefix='Composer.')
+    profiling.instrument(pdflatex_runner,['run_pdflatex','compile_tex','wait_pdflatex'],prefix='pdflatex_runner.')
+
+
+def make_forms(args,forms,jobs):
+
+    # make the forms requested on the command line, skipping those whose inputs are unchanged
+
+    piecedict = tsv_to_piecedict(args.tsv)
+    candidates = sorted(list(piecedict.keys()),key=int)
+
+    # digests of the inputs of each output from the last run; outputs whose inputs are unchanged are skipped
+    manifestfile = examyear+'_manifest.json'
+    if args.force:
+        oldmanifest = {}
+    else:
+        oldmanifest = load_manifest(manifestfile)
+    manifest = dict(oldmanifest)
+    params = {'examyear':examyear,'jurors':jurors,'req_piece_std_format':req_piece_std_format}
+
+    # find candidates whose program, templates or parameters changed since the last run
+    adjcands = []
+    if 'adj' in forms:
+        templatedigests = [file_digest(template1),file_digest(template2)]
+        skipped = []
+        for candidate in candidates:
+            manifest['adj'+candidate] = inputs_digest(params,templatedigests,piecedict[candidate])
+            if up_to_date(oldmanifest,'adj'+candidate,manifest['adj'+candidate],adjform_paths(candidate)):
+                skipped.append(candidate)
+            else:
+                adjcands.append(candidate)
+        if skipped:
+            print('adjudication forms unchanged, skipped candidate(s) '+', '.join(skipped))
+
+    # whole-committee forms are skipped if none of their inputs changed since the last run
+    makeforms = list(forms)
+
+    if 'req' in forms:
+        reqpiecedict = get_reqpiecedict(candidates,piecedict)
+        manifest['req'] = inputs_digest(params,file_digest(template3),candidates,reqpiecedict)
+        if up_to_date(oldmanifest,'req',manifest['req'],reqform_paths()):
+            print('required piece form unchanged, skipped')
+            makeforms.remove('req')
+
+    if 'rep' in forms:
+        manifest['rep'] = inputs_digest(params,file_digest(template4),candidates)
+        if up_to_date(oldmanifest,'rep',manifest['rep'],repform_paths()):
+            print('repertoire piece form unchanged, skipped')
+            makeforms.remove('rep')
+
+    if 'prog' in forms:
+        manifest['prog'] = inputs_digest(examyear,[[candidate,piecedict[candidate]] for candidate in candidates])
+        if up_to_date(oldmanifest,'prog',manifest['prog'],progform_paths()):
+            print('program listing unchanged, skipped')
+            makeforms.remove('prog')
+
+    if args.dry_run:
+        if 'adj' in makeforms and adjcands:
+            print('would make adjudication forms for candidate(s) '+', '.join(adjcands))
+        for form,label in [('req','required piece form'),('rep','repertoire piece form'),('prog','program listing')]:
+            if form in makeforms:
+                print('would make '+label)
+        return
+
+    # program listing first, so pdflatex runs while the .docx forms are made
+    if 'prog' in makeforms:
+        make_progfile(candidates,piecedict)
+
+    if 'adj' in makeforms and adjcands:
+        make_adjforms(adjcands,piecedict,jobs)
+
+    if 'req' in makeforms:
+        make_reqform(candidates,reqpiecedict)
+
+    if 'rep' in makeforms:
+        make_repform(candidates)
+
+    close_bundles()
+    pdflatex_runner.wait_pdflatex()
+
+    # record inputs of everything built (or confirmed up to date) in this run
+    with open(manifestfile,'w') as fh:
+        json.dump(manifest,fh,indent=4,sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
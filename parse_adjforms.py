@@ -15,6 +15,13 @@ Collect all .docx files returned by jurors, and a copy of parse_adjforms.py, int
 Make that directory the current working directory.
 
 $ python3 parse_adjforms.py
+$ python3 parse_adjforms.py --jobs 4        (read adjudication forms in 4 worker processes; 0 = one per core)
+$ python3 parse_adjforms.py --no-cache      (read all forms again, instead of reusing records of unchanged forms)
+$ python3 parse_adjforms.py --watch         (then keep updating the results as forms arrive, until ctrl-C)
+$ python3 parse_adjforms.py --pipeline      (overlap reading, parsing, combining adjudications and pdflatex)
+$ python3 parse_adjforms.py --db gcna_results.db   (also store the results in a database of all cycles, see results_db.py)
+$ python3 parse_adjforms.py --profile       (time each stage and the main helpers, report in <examyear>_parse_profile.json;
+                                             add --pstats parse.pstats for a cProfile dump)
 
 *** NB : move all extraneous juror files *out* of directory before running
 *** NB : close all docx files to be parsed before running
@@ -25,16 +32,24 @@ THINGS TO BE EDITED EACH YEAR:
 -- "Parameters"
 '''
 
-import copy
-import glob
+import argparse
+import contextlib
+import hashlib
+import io
 import json
 import os
 import random
-import subprocess
+import re
+import time
+import zipfile
 
+import pdflatex_runner
+
+from collections import namedtuple
 from docx import Document
 from docx.enum.text import WD_BREAK
 from docxcompose.composer import Composer
+from lxml import etree
 #from docx2pdf import convert
 
 
@@ -63,19 +78,358 @@ numrequired = 5
 # 'prelim' for pre-juror discussing, 'final' for post-juror discussion
 labelstr = 'final'
 
+# read adjudication forms straight from their XML (True), or always through python-docx (False)
+fast_extract = True
+
+# lasting identifiers of candidates (e.g. member numbers), item format <candidate number> : <identifier>
+# only used with --db, to follow candidates who retake the exam from one cycle to the next
+candidate_ids = {}
+
 
 ############################
 ##### Helper functions #####
 ############################
 
-def insensitive_glob(pattern):
+def form_kind(filename):
 
-    # return all filenames containing case-insensitive version of pattern
-    
-    def either(c):
-        return '[%s%s]' % (c.lower(), c.upper()) if c.isalpha() else c
-    
-    return glob.glob(''.join(map(either, pattern)))
+    # kind of juror form from its filename: 'prelim', 'repertoire', 'required' or 'adjudication'
+
+    name = filename.lower()
+    for kind in ['prelim','repertoire','required']:
+        if kind in name:
+            return kind
+
+    return 'adjudication'
+
+
+def form_candidate(filename):
+
+    # candidate number in filename ('..._candidate<number>_...'), or None
+
+    match = re.search(r'candidate(\d+)_',filename.lower())
+
+    return match.group(1) if match else None
+
+
+def index_forms(jurors,dirname='.'):
+
+    # scan directory once for juror .docx forms (skipping Word lock files), matching juror names case-insensitively
+    # returns dictionary, item format (<juror>, <candidate number or None>, <kind>) : [list of filenames]
+    #    with filenames in directory order
+    # prints files that match more than one juror, and keys with more than one file
+
+    index = {}
+    for entry in os.scandir(dirname):
+        name = entry.name
+        # skip hidden files, and the lock files Word leaves next to open documents
+        if name.startswith(('.','~$')) or not name.lower().endswith('docx'):
+            continue
+
+        matched = [juror for juror in jurors if juror.lower() in name.lower()]
+        if len(matched) > 1:
+            print(name+' : matches more than one juror ('+', '.join(matched)+')')
+
+        for juror in matched:
+            index.setdefault((juror,form_candidate(name),form_kind(name)),[]).append(name)
+
+    for (juror,candidate,kind),names in index.items():
+        if len(names) > 1 and (candidate or kind != 'adjudication'):
+            print(juror+('/cand '+candidate if candidate else '')+' : more than one '+kind+' form ('+', '.join(names)+')')
+
+    return index
+
+
+def indexed_forms(index,juror,kind,candidate=''):
+
+    # filenames of juror's forms of this kind (and for this candidate, if given)
+    # a lookup for one candidate is a single dictionary lookup; without a candidate, the index is scanned
+
+    if candidate:
+        return list(index.get((juror,candidate,kind),[]))
+
+    return [name for (thisjuror,thiscand,thiskind),names in index.items() for name in names
+            if thisjuror == juror and thiskind == kind]
+
+
+# WordprocessingML namespace, as it prefixes tags in word/document.xml
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+# stand-ins for the python-docx objects used by the get_* functions, filled by read_fast_form
+FastDoc = namedtuple('FastDoc','paragraphs tables')
+FastTable = namedtuple('FastTable','rows')
+FastRow = namedtuple('FastRow','cells')
+FastCell = namedtuple('FastCell','paragraphs')
+FastParagraph = namedtuple('FastParagraph','text runs')
+FastRun = namedtuple('FastRun','text font')
+FastFont = namedtuple('FastFont','bold underline strike highlight_color')
+
+
+def fast_onoff(elem):
+
+    # value of an on/off property like w:b or w:strike, as python-docx reads it
+
+    if elem is None:
+        return None
+
+    val = elem.get(W+'val')
+    if val is None or val in ['1','true','on']:
+        return True
+    elif val in ['0','false','off']:
+        return False
+    else:
+        raise ValueError('bad on/off value '+val)
+
+
+# text-bearing children of the runs of a paragraph, in document order
+fast_textnodes = etree.XPath(' | '.join(prefix+'/w:'+tag for prefix in ['w:r','w:hyperlink/w:r']
+                                        for tag in ['t','tab','ptab','br','cr','noBreakHyphen']),
+                             namespaces={'w':W[1:-1]})
+
+# text of run children other than w:t; w:br counts only if it's a line break
+fast_nodetext = {W+'tab':'\t',W+'ptab':'\t',W+'cr':'\n',W+'noBreakHyphen':'-'}
+
+
+def fast_text(nodes):
+
+    # text of run children, as python-docx builds it
+
+    text = ''
+    for node in nodes:
+        if node.tag == W+'t':
+            text += node.text or ''
+        elif node.tag == W+'br':
+            if node.get(W+'type','textWrapping') == 'textWrapping':
+                text += '\n'
+        else:
+            text += fast_nodetext[node.tag]
+
+    return text
+
+
+def fast_run(r):
+
+    # text and formatting flags of a w:r element
+
+    text = fast_text(r.iterchildren(W+'t',W+'tab',W+'ptab',W+'br',W+'cr',W+'noBreakHyphen'))
+
+    rpr = r.find(W+'rPr')
+    if rpr is None:
+        return FastRun(text,FastFont(None,None,None,None))
+
+    u = rpr.find(W+'u')
+    if u is None or u.get(W+'val') is None:
+        underline = None
+    else:
+        underline = u.get(W+'val') != 'none'
+
+    highlight = rpr.find(W+'highlight')
+    if highlight is None:
+        highlight_color = None
+    else:
+        highlight_color = highlight.get(W+'val') not in ['default','none']
+
+    return FastRun(text,FastFont(fast_onoff(rpr.find(W+'b')),underline,fast_onoff(rpr.find(W+'strike')),highlight_color))
+
+
+def fast_paragraph(p,withruns=True):
+
+    # text and runs of a w:p element; hyperlink text counts in the text but its runs aren't listed
+    # without withruns, runs is left as None, to save time on paragraphs only read for their text
+
+    text = fast_text(fast_textnodes(p))
+
+    if withruns:
+        runs = [fast_run(r) for r in p.iterchildren(W+'r')]
+    else:
+        runs = None
+
+    return FastParagraph(text,runs)
+
+
+def fast_table(tbl):
+
+    # rows of cells of paragraphs of a w:tbl element
+    # merged or offset cells change how python-docx numbers cells, so only plain rows are kept
+
+    rows = []
+    for tr in tbl.findall(W+'tr'):
+        if tr.find(W+'trPr/'+W+'gridBefore') is not None or tr.find(W+'trPr/'+W+'gridAfter') is not None \
+           or tr.find(W+'tc/'+W+'tcPr/'+W+'gridSpan') is not None or tr.find(W+'tc/'+W+'tcPr/'+W+'vMerge') is not None:
+            rows.append(None)
+        else:
+            rows.append(FastRow([FastCell([fast_paragraph(p) for p in tc.findall(W+'p')]) for tc in tr.findall(W+'tc')]))
+
+    return FastTable(rows)
+
+
+def read_fast_form(filename):
+
+    # read adjudication form (filename, or file object) straight from word/document.xml, streamed in one pass
+    # collects the text of every body paragraph, run formatting of the grade ('Candidate ...') lines,
+    #    and the cells of the first table; each body element is cleared once read, so the tree is never held whole
+    # returns None if the form can't be classified as an adjudication form this way;
+    #    the caller should then use Document()
+
+    paragraphs = []
+    tables = []
+
+    try:
+        with zipfile.ZipFile(filename) as zf, zf.open('word/document.xml') as fh:
+            for event,elem in etree.iterparse(fh,events=('end',),tag=(W+'p',W+'tbl')):
+                body = elem.getparent()
+                if body is None or body.tag != W+'body':
+                    # paragraphs of tables and text boxes are read with their body element
+                    continue
+                if elem.tag == W+'p':
+                    paragraph = fast_paragraph(elem,withruns=False)
+                    if paragraph.text[:9] == 'Candidate':
+                        paragraph = fast_paragraph(elem)
+                    paragraphs.append(paragraph)
+                elif not tables:
+                    tables.append(fast_table(elem))
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del body[0]
+    except (KeyError,ValueError,zipfile.BadZipFile,etree.XMLSyntaxError):
+        return None
+
+    # overall mark is read from row 2, cell 2 of the first table, so that row has to be plain
+    if len(paragraphs) < 4 or not paragraphs[3].text.startswith('Candidate'):
+        return None
+    if not tables or len(tables[0].rows) < 2 or tables[0].rows[1] is None:
+        return None
+
+    return FastDoc(paragraphs,tables)
+
+
+# everything read from one adjudication form, as consumed by record_grades and record_overall
+AdjRecord = namedtuple('AdjRecord','filename candidate pieces reqlist grades overall')
+
+
+def read_adjrecord(adjform,filename):
+
+    # extract candidate number, pieces, req/non-req flags, piece grades and overall mark from adjform Document
+    # walks the paragraphs once, reading each paragraph's text once
+
+    paragraphs = adjform.paragraphs
+    texts = [par.text for par in paragraphs]
+
+    pieces = []
+    reqlist = []
+    grades = []
+    for ind,text in enumerate(texts):
+        if text == 'piece\t\t\t\t\t\t\tcomposer':
+            pieces.append(texts[ind-1].split('\t')[0])
+        elif text[:8] == 'Required':
+            reqlist.append(get_req_flag(text))
+        elif text[:9] == 'Candidate':
+            grades.append(get_pf_grade(paragraphs[ind],text))
+
+    return AdjRecord(filename,texts[3].split('\t')[0].split('.')[-1].strip(),
+                     tuple(pieces),tuple(reqlist),tuple(grades),get_overall(adjform))
+
+
+def load_adjrecord(filename,data=None):
+
+    # read adjudication form file (or its contents, data, if already read) into its AdjRecord;
+    #    runs in a worker process with --jobs
+    # fall back to python-docx if the fast reader can't classify the form
+
+    adjform = None
+    if fast_extract:
+        adjform = read_fast_form(filename if data is None else io.BytesIO(data))
+    if adjform is None:
+        adjform = Document(filename if data is None else io.BytesIO(data))
+
+    return read_adjrecord(adjform,filename)
+
+
+def load_form(kind,filename,data=None):
+
+    # record read from juror form of this kind, from the file or its contents, data
+    # AdjRecord for adjudication forms, votes list for repertoire and required piece forms
+
+    if kind == 'adjudication':
+        return load_adjrecord(filename,data)
+
+    form = Document(filename if data is None else io.BytesIO(data))
+    if kind == 'repertoire':
+        return read_repvotes(form)
+
+    return read_reqvotes(form)
+
+
+# records read from forms are cached between runs in <examyear>_parsecache.json:
+#    {'version':parsecache_version, 'files':{filename:[size,mtime,sha256]}, 'records':{sha256:[kind,record]}}
+# change parsecache_version whenever the records read from forms change, so older caches are ignored
+parsecache_version = 2
+
+
+def new_parsecache():
+
+    return {'version':parsecache_version,'files':{},'records':{}}
+
+
+def load_parsecache(cachefile):
+
+    # read parse cache from the last run; empty if there is none, or it was written by another version
+
+    try:
+        with open(cachefile,'r') as fh:
+            cache = json.load(fh)
+    except (OSError,ValueError):
+        return new_parsecache()
+
+    if not isinstance(cache,dict) or cache.get('version') != parsecache_version:
+        return new_parsecache()
+
+    return cache
+
+
+def file_digest(filename):
+
+    # sha256 of a file's contents
+
+    with open(filename,'rb') as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
+
+
+def cached_digest(oldcache,filename,stat):
+
+    # digest of file from the last run if its size and mtime (from stat) are unchanged, otherwise None
+
+    entry = oldcache['files'].get(filename)
+    if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+        return entry[2]
+
+    return None
+
+
+def cached_record(oldcache,newcache,filename,kind,data=None):
+
+    # look up record of this kind read from a file with the same contents on an earlier run
+    # files with the same size and mtime as last time aren't hashed again; data is the file's contents, if already read
+    # returns (digest, record or None); digest and any record found are carried over to newcache
+
+    stat = os.stat(filename)
+    digest = cached_digest(oldcache,filename,stat)
+    if digest is None:
+        digest = file_digest(filename) if data is None else hashlib.sha256(data).hexdigest()
+    newcache['files'][filename] = [stat.st_size,stat.st_mtime_ns,digest]
+
+    cached = oldcache['records'].get(digest)
+    if cached and cached[0] == kind:
+        newcache['records'][digest] = cached
+        return digest,cached[1]
+
+    return digest,None
+
+
+def store_record(newcache,digest,kind,record):
+
+    # add json-serializable record read from file with this digest to newcache
+
+    newcache['records'][digest] = [kind,record]
 
 
 def get_candnumber(adjform):
@@ -89,9 +443,9 @@ def get_pieces(adjform):
 
     # extract piece names from adjform Document
 
-    piecelines = [ind-1 for ind,par in enumerate(adjform.paragraphs) if par.text == 'piece\t\t\t\t\t\t\tcomposer']
+    texts = [par.text for par in adjform.paragraphs]
 
-    return [adjform.paragraphs[ind].text.split('\t')[0] for ind in piecelines]
+    return [texts[ind-1].split('\t')[0] for ind,text in enumerate(texts) if text == 'piece\t\t\t\t\t\t\tcomposer']
 
 
 def get_grades(adjform):
@@ -152,38 +506,39 @@ def get_pf_grades(adjform):
 
     # extract pass/fail grades from adjform Document for individual pieces
 
-    gradelines = [par for par in adjform.paragraphs if par.text[:9] == 'Candidate']
+    return [get_pf_grade(par,par.text) for par in adjform.paragraphs if par.text[:9] == 'Candidate']
 
-    grades = []
-    for line in gradelines:
-        gradestr = line.text.split('Rating:')[1]
-        if 'not' not in gradestr.lower():
-            passmark = 'x'
-            failmark = ''
-        elif gradestr.lower().count('pass') == 1:
-            passmark = ''
-            failmark = 'x'
-        else:
-            passmark = gradestr.split('passing')[0].strip().replace('_','')
-            failmark = line.text.split('passing')[1].split('not')[0].strip().replace('_','')
 
-        if passmark and not failmark:
+def get_pf_grade(line,text):
+
+    # extract pass/fail grade from one 'Candidate ... Rating:' paragraph, whose text is given
+
+    gradestr = text.split('Rating:')[1]
+    if 'not' not in gradestr.lower():
+        passmark = 'x'
+        failmark = ''
+    elif gradestr.lower().count('pass') == 1:
+        passmark = ''
+        failmark = 'x'
+    else:
+        passmark = gradestr.split('passing')[0].strip().replace('_','')
+        failmark = text.split('passing')[1].split('not')[0].strip().replace('_','')
+
+    if passmark and not failmark:
+        thisgrade = 1
+    elif failmark and not passmark:
+        thisgrade = -1
+    elif passmark and failmark:
+        if passmark.lower() in ['y','yes'] and failmark.lower in ['n','no']:
             thisgrade = 1
-        elif failmark and not passmark:
+        elif passmark.lower() in ['n','no'] and failmark.lower in ['y','yes']:
             thisgrade = -1
-        elif passmark and failmark:
-            if passmark.lower() in ['y','yes'] and failmark.lower in ['n','no']:
-                thisgrade = 1
-            elif passmark.lower() in ['n','no'] and failmark.lower in ['y','yes']:
-                thisgrade = -1
-            else:
-                thisgrade = check_grade_formatting(line)
         else:
             thisgrade = check_grade_formatting(line)
-            
-        grades.append(thisgrade)
+    else:
+        thisgrade = check_grade_formatting(line)
 
-    return grades
+    return thisgrade
 
 
 def check_grade_formatting(par):
@@ -219,19 +574,20 @@ def get_req(adjform):
     # extract req/non-req piece order from adjform Document
     # 1 = required , 0 = non-required
 
-    reqlines = [par.text for par in adjform.paragraphs if par.text[:8] == 'Required']
+    return [get_req_flag(par.text) for par in adjform.paragraphs if par.text[:8] == 'Required']
 
-    reqlist = []
-    for line in reqlines:
-        reqstr = line.split('\t')[1].strip()
-        if reqstr == 'Yes':
-            reqlist.append(1)
-        elif reqstr == 'No':
-            reqlist.append(0)
-        else:
-            reqlist.append(-1)
 
-    return reqlist
+def get_req_flag(line):
+
+    # req/non-req flag from one 'Required' line: 1 = required, 0 = non-required, -1 = can't tell
+
+    reqstr = line.split('\t')[1].strip()
+    if reqstr == 'Yes':
+        return 1
+    elif reqstr == 'No':
+        return 0
+    else:
+        return -1
         
 
 def get_overall(adjform):
@@ -268,6 +624,8 @@ def get_overall(adjform):
                 overall = 'fail'
             elif notpassrun[0].font.strike:
                 overall = 'pass'
+            elif passrun[0].font.strike:
+                overall = 'fail'
             elif notpassrun[0].font.highlight_color and not passrun[0].font.highlight_color:
                 overall = 'fail'
             else:
@@ -283,14 +641,137 @@ def get_overall(adjform):
     return overall
     
 
-def record_grades(thisdict,pieces,grades):
+class ResultsStore:
+
+    # results of all forms read so far, updated in place as each form is recorded
+    # jurors, candidates and pieces are interned as integer ids; per-juror grades are lists indexed by juror id
+    # to_dict() gives the results dictionary layout written to results<year>.json:
+    #    {candidate : {'pass':[jurors], 'fail':[jurors], 'required':{piece:[jurors]},
+    #                  'repertoire':{piece:{1:[jurors], 2:[jurors], 3:[jurors]}}, piece:{juror:grade}, ...}}
+
+    __slots__ = ('candidates','jurors','pieces','candid','jurorid','pieceid',
+                 'grades','required','passes','fails','reqvotes','repvotes')
+
+    def __init__(self,candidates,jurors):
+
+        self.candidates = list(candidates)
+        self.candid = {candidate:ind for ind,candidate in enumerate(self.candidates)}
+        self.jurors = []
+        self.jurorid = {}
+        self.pieces = []
+        self.pieceid = {}
+        for juror in jurors:
+            self.juror_id(juror)
+
+        # per candidate: {pieceid : [grade per juror id, None if no grade]}, in order pieces were first graded
+        self.grades = [{} for candidate in self.candidates]
+        # per candidate: piece ids marked required on an adjudication form
+        self.required = [set() for candidate in self.candidates]
+        # per candidate: juror ids marking overall pass / fail, in order recorded
+        self.passes = [[] for candidate in self.candidates]
+        self.fails = [[] for candidate in self.candidates]
+        # per candidate: {pieceid : [juror ids]}
+        self.reqvotes = [{} for candidate in self.candidates]
+        # per candidate: {pieceid : [juror ids for 1st choice, 2nd, 3rd; None if no votes]}
+        self.repvotes = [{} for candidate in self.candidates]
+
+    def juror_id(self,juror):
+
+        if juror not in self.jurorid:
+            self.jurorid[juror] = len(self.jurors)
+            self.jurors.append(juror)
+        return self.jurorid[juror]
+
+    def piece_id(self,piece):
+
+        if piece not in self.pieceid:
+            self.pieceid[piece] = len(self.pieces)
+            self.pieces.append(piece)
+        return self.pieceid[piece]
+
+    def set_grade(self,candidate,piece,juror,gradecode):
+
+        jid = self.juror_id(juror)
+        piecegrades = self.grades[self.candid[candidate]].setdefault(self.piece_id(piece),[])
+        if len(piecegrades) <= jid:
+            piecegrades.extend([None]*(jid+1-len(piecegrades)))
+        piecegrades[jid] = gradecode
+
+    def mark_required(self,candidate,piece):
+
+        self.required[self.candid[candidate]].add(self.piece_id(piece))
+
+    def add_overall(self,candidate,overall,juror):
+
+        # overall is 'pass' or 'fail'
+        if overall == 'pass':
+            self.passes[self.candid[candidate]].append(self.juror_id(juror))
+        else:
+            self.fails[self.candid[candidate]].append(self.juror_id(juror))
+
+    def add_reqpiece(self,candidate,piece):
+
+        return self.reqvotes[self.candid[candidate]].setdefault(self.piece_id(piece),[])
 
-    # record grades for this juror in results dictionary
+    def add_reqvote(self,candidate,piece,juror):
+
+        self.add_reqpiece(candidate,piece).append(self.juror_id(juror))
+
+    def add_repvote(self,candidate,piece,choice,juror):
+
+        # choice is 1, 2 or 3
+        choices = self.repvotes[self.candid[candidate]].setdefault(self.piece_id(piece),[None,None,None])
+        if choices[choice-1] is None:
+            choices[choice-1] = []
+        choices[choice-1].append(self.juror_id(juror))
+
+    def clear_candidate(self,candidate):
+
+        # forget everything recorded for candidate, so its forms can be recorded again
+        cid = self.candid[candidate]
+        self.grades[cid] = {}
+        self.required[cid] = set()
+        self.passes[cid] = []
+        self.fails[cid] = []
+        self.reqvotes[cid] = {}
+        self.repvotes[cid] = {}
+
+    def candidate_dict(self,cid):
+
+        jurors = self.jurors
+        pieces = self.pieces
+
+        thisdict = {'pass':[jurors[jid] for jid in self.passes[cid]],
+                    'fail':[jurors[jid] for jid in self.fails[cid]],
+                    'required':{pieces[pid]:[jurors[jid] for jid in jids] for pid,jids in self.reqvotes[cid].items()},
+                    'repertoire':{pieces[pid]:{ind+1:[jurors[jid] for jid in jids or []] for ind,jids in enumerate(choices)}
+                                  for pid,choices in self.repvotes[cid].items()}}
+        for pid,piecegrades in self.grades[cid].items():
+            thisdict[pieces[pid]] = {jurors[jid]:grade for jid,grade in enumerate(piecegrades) if grade is not None}
+
+        return thisdict
+
+    def to_dict(self):
+
+        return {candidate:self.candidate_dict(cid) for cid,candidate in enumerate(self.candidates)}
+
+    def required_pieces(self):
+
+        # {candidate : [required piece titles]}, as marked on the adjudication forms
+        return {candidate:[self.pieces[pid] for pid in self.grades[cid] if pid in self.required[cid]]
+                for cid,candidate in enumerate(self.candidates)}
+
+
+def record_grades(results,record,juror):
+
+    # record grades from this juror's form record in results store
+
+    candidate = record.candidate
     
-    for ind in range(len(pieces)):
+    for ind in range(len(record.pieces)):
 
-        piece = pieces[ind]
-        grade = grades[ind]
+        piece = record.pieces[ind]
+        grade = record.grades[ind]
         
         if grade == 0:
             print('cand '+candidate+'/'+juror+'/'+piece+' : missing grade')
@@ -303,49 +784,64 @@ def record_grades(thisdict,pieces,grades):
             print('cand '+candidate+'/'+juror+'/'+piece+' : unknown grade '+str(grade))
             gradecode = str(grade)
             
-        if piece not in thisdict.keys():
-            thisdict[piece] = {juror:gradecode}
-        else:
-            thisdict[piece][juror] = gradecode
+        results.set_grade(candidate,piece,juror,gradecode)
+        if ind < len(record.reqlist) and record.reqlist[ind] == 1:
+            results.mark_required(candidate,piece)
+
+    return results
 
-    return thisdict
 
+def record_overall(results,record,juror):
 
-def record_overall(thisdict,overall,req_outcomes):
+    # record overall grade from this juror's form record, check for consistency with req piece grades
 
-    # record overall grade, check for consistency
+    candidate = record.candidate
+    overall = record.overall
+    req_outcomes = [record.grades[ind]*record.reqlist[ind] for ind in range(len(record.pieces))]
 
     if overall == 'pass':
-        thisdict['pass'].append(juror)
+        results.add_overall(candidate,'pass',juror)
         #if any(prod>0 and prod<3 for prod in req_outcomes):
         if any(prod < 0 for prod in req_outcomes):
             print('cand '+candidate+'/'+juror+' : overall pass, failed req')
     elif overall == 'fail':
-        thisdict['fail'].append(juror)
+        results.add_overall(candidate,'fail',juror)
         #if all(prod==0 or prod>=3 for prod in req_outcomes):
         if all(prod >= 0 for prod in req_outcomes):
             print('cand '+candidate+'/'+juror+' : overall fail, all req passed')
     else:
         print('cand '+candidate+'/'+juror+' : overall mark "'+overall+'"')
 
-    return thisdict
+    return results
 
 
-def record_repvotes(repform,results,juror):
+def read_repvotes(repform):
 
-    # read juror's votes from repertoire form, record in results dictionary
-    
-    for rownum in range(len(repform.tables[0].rows) - 1):
-        thiscand,piece1,piece2,piece3 = [repform.tables[0].row_cells(rownum+1)[ind].text for ind in range(4)]
+    # read juror's votes from repertoire form
+    # returns list of [candidate, 1st choice, 2nd choice, 3rd choice] for each candidate row with votes
+
+    repvotes = []
+    table = repform.tables[0]
+    for rownum in range(len(table.rows) - 1):
+        thiscand,piece1,piece2,piece3 = [cell.text for cell in table.row_cells(rownum+1)[:4]]
         
         if thiscand and any([piece1,piece2,piece3]):
-            thisdict = copy.deepcopy(results[thiscand]['repertoire'])
-            results[thiscand]['repertoire'] = write_repvotes(thisdict,thiscand,juror,piece1,piece2,piece3)
+            repvotes.append([thiscand,piece1,piece2,piece3])
+
+    return repvotes
+
+
+def record_repvotes(repvotes,results,juror):
+
+    # record juror's repertoire form votes in results store
+    
+    for thiscand,piece1,piece2,piece3 in repvotes:
+        results = write_repvotes(results,thiscand,juror,piece1,piece2,piece3)
 
     return results
 
 
-def write_repvotes(thisdict,thiscand,juror,piece1,piece2,piece3):
+def write_repvotes(results,thiscand,juror,piece1,piece2,piece3):
 
     # record a single juror's repertoire piece votes for a single candidate
 
@@ -353,71 +849,98 @@ def write_repvotes(thisdict,thiscand,juror,piece1,piece2,piece3):
     for ind in [1,2,3]:
         piece = pieces[ind-1]
         if piece:
-            if piece not in thisdict.keys():
-                thisdict[piece] = {ind:[juror]}
-            elif ind not in thisdict[piece].keys():
-                thisdict[piece][ind] = [juror]
-            else:
-                thisdict[piece][ind].append(juror)
+            results.add_repvote(thiscand,piece,ind,juror)
         else:
             print(thiscand+' : missing repertoire piece '+str(ind))
 
-    return thisdict
+    return results
 
 
-def record_reqvotes(reqform,results,juror):
+def read_reqvotes(reqform):
 
-    # read juror's votes from required piece form, record in results dictionary
+    # read juror's votes from required piece form
+    # returns list of [candidate, technical piece, expressive piece, vote] for each candidate,
+    #    vote being 'tech', 'exp' or '' if it can't be parsed
     
-    parind = [ind for ind,par in enumerate(reqform.paragraphs) if 'Candidate' in par.text]
+    paragraphs = reqform.paragraphs
+    parind = [ind for ind,par in enumerate(paragraphs) if 'Candidate' in par.text]
     
+    reqvotes = []
     for ind in parind:
         
-        thiscand,techpiece,techmark = reqform.paragraphs[ind].text.split('\t')
-        _,exppiece,expmark = reqform.paragraphs[ind+1].text.split('\t')
+        thiscand,techpiece,techmark = paragraphs[ind].text.split('\t')
+        _,exppiece,expmark = paragraphs[ind+1].text.split('\t')
         
         thiscand = thiscand.split()[-1]
         techmark = techmark.replace('_','')
         expmark = expmark.replace('_','')
-        techruns = reqform.paragraphs[ind].runs
-        expruns = reqform.paragraphs[ind+1].runs
+        techruns = title_runs(paragraphs[ind])
+        expruns = title_runs(paragraphs[ind+1])
         
-        thisdict = copy.deepcopy(results[thiscand]['required'])
-        results[thiscand]['required'] = write_reqvote(thiscand,thisdict,juror,techpiece,exppiece,techmark,expmark,techruns,expruns)
+        reqvotes.append([thiscand,techpiece,exppiece,get_reqvote(techpiece,exppiece,techmark,expmark,techruns,expruns)])
             
-    return results
+    return reqvotes
 
 
-def write_reqvote(cand,thisdict,juror,techpiece,exppiece,techmark,expmark,techruns,expruns):
+def title_runs(par):
 
-    # record juror's required piece vote for a single candidate
+    # runs of a required piece form line after its first tab, leaving out the (bold) 'Candidate <number>' label,
+    #    whose 'and' would otherwise count as a word of titles like 'Cortege and Fugue'
+
+    runs = par.runs
+    for ind,run in enumerate(runs):
+        if '\t' in run.text:
+            return runs[ind:]
+
+    return runs
+
+
+def get_reqvote(techpiece,exppiece,techmark,expmark,techruns,expruns):
+
+    # juror's required piece vote for a single candidate: 'tech', 'exp' or '' if it can't be parsed
 
-    if techpiece not in thisdict.keys():
-        thisdict[techpiece] = []
-    if exppiece not in thisdict.keys():
-        thisdict[exppiece] = []
-    
     if techmark and not expmark:
-        thisdict[techpiece].append(juror)
+        vote = 'tech'
     elif expmark and not techmark:
-        thisdict[exppiece].append(juror)
+        vote = 'exp'
     elif techmark and expmark:
         if '1' in techmark and '1' not in expmark:
-            thisdict[techpiece].append(juror)
+            vote = 'tech'
         elif '1' in expmark and '1' not in techmark:
-            thisdict[exppiece].append(juror)
+            vote = 'exp'
         else:
-            print(cand+" : can't parse required piece vote")
+            vote = ''
     else:
         vote = check_vote_formatting(techpiece,exppiece,techruns,expruns)
-        if vote == 'tech':
-            thisdict[techpiece].append(juror)
-        elif vote == 'exp':
-            thisdict[exppiece].append(juror)
-        else:
-            print(cand+" : can't parse required piece vote")
 
-    return thisdict
+    return vote
+
+
+def record_reqvotes(reqvotes,results,juror):
+
+    # record juror's required piece form votes in results store
+
+    for thiscand,techpiece,exppiece,vote in reqvotes:
+        results = write_reqvote(thiscand,results,juror,techpiece,exppiece,vote)
+
+    return results
+
+
+def write_reqvote(cand,results,juror,techpiece,exppiece,vote):
+
+    # record juror's required piece vote for a single candidate
+
+    results.add_reqpiece(cand,techpiece)
+    results.add_reqpiece(cand,exppiece)
+    
+    if vote == 'tech':
+        results.add_reqvote(cand,techpiece,juror)
+    elif vote == 'exp':
+        results.add_reqvote(cand,exppiece,juror)
+    else:
+        print(cand+" : can't parse required piece vote")
+
+    return results
 
 
 def check_vote_formatting(techpiece,exppiece,techruns,expruns):
@@ -452,142 +975,238 @@ def check_vote_formatting(techpiece,exppiece,techruns,expruns):
     return result
 
             
-def make_jurorsummary(results,jurors,voting,conflicts):
+def top_pieces(results,scores,pids):
 
-    # construct summary of overall grades for committee reference
+    # titles of the pieces (ids in pids) with the highest of scores, indexed by piece id, in the order of pids;
+    #    more than one if tied
+
+    if not pids:
+        return []
+
+    best = max(scores[pid] for pid in pids)
+
+    return [results.pieces[pid] for pid in pids if scores[pid] == best]
+
+
+def tally_votes(results,cids=None):
+
+    # tally votes for all candidates at once (or those with ids in cids) from results store
+    # each vote list of the store is gone through once, into candidate x juror tables of overall pass / fail
+    #    marks, a candidate x piece table of required piece votes and a candidate x piece x rank table of
+    #    repertoire piece choices; repertoire scores are 3 for each 1st choice, 2 for 2nd, 1 for 3rd
+    # returns list, one item per candidate, of dictionaries with
+    #    'pass', 'fail' : the candidate's row of the pass / fail tables, indexed by juror id
+    #    'reqpieces' : required pieces with the most votes (more than one if tied)
+    #    'reppieces' : repertoire pieces with the highest score (more than one if tied)
+    # tied pieces are listed in the order they were first voted for
+
+    if cids is None:
+        cids = range(len(results.candidates))
+    cids = list(cids)
+    numjurors = len(results.jurors)
+    numpieces = len(results.pieces)
+
+    passtable = [[0]*numjurors for cid in cids]
+    failtable = [[0]*numjurors for cid in cids]
+    reqtable = [[0]*numpieces for cid in cids]
+    ranktable = [[[0,0,0] for pid in range(numpieces)] for cid in cids]
+
+    for row,cid in enumerate(cids):
+        for jid in results.passes[cid]:
+            passtable[row][jid] += 1
+        for jid in results.fails[cid]:
+            failtable[row][jid] += 1
+        for pid,jids in results.reqvotes[cid].items():
+            reqtable[row][pid] += len(jids)
+        for pid,choices in results.repvotes[cid].items():
+            for rank,jids in enumerate(choices):
+                ranktable[row][pid][rank] += len(jids or [])
+
+    reptable = [[3*first+2*second+third for first,second,third in ranks] for ranks in ranktable]
+
+    # pieces voted for, for each candidate; only these can be picked
+    reqvoted = [list(results.reqvotes[cid]) for cid in cids]
+    repvoted = [list(results.repvotes[cid]) for cid in cids]
+
+    return [{'pass':passtable[row],'fail':failtable[row],
+             'reqpieces':top_pieces(results,reqtable[row],reqvoted[row]),
+             'reppieces':top_pieces(results,reptable[row],repvoted[row])}
+            for row in range(len(cids))]
+
+
+def alternate_choices():
+
+    # nonvoting jurors, and a random choice of one of them for each candidate, for picking voting jurors
+    # candidates use up the choices in order, one each, unless they have too few jurors for any choice (see candidate_voting)
 
-    # find nonvoting jurors, set up random choice of one for each candidate
     altjurors = [x for x in jurors if x not in voting]
     if altjurors:
         altchoices = random.Random(int(examyear)).choices(range(len(altjurors)),[1]*len(altjurors),k=len(candidates))
     else:
         altchoices = []
 
-    votingsummary = {}
-    
-    for candidate in candidates:
+    return altjurors,altchoices
 
-        # check which jurors marked this candidate
-        thisjurors = results[candidate]['pass'] + results[candidate]['fail']
-        thisaltjurors = [x for x in altjurors if x in thisjurors]
 
-        # check for juror recusals
-        if candidate in conflict.keys():
-            recuse = conflict[candidate]
-        else:
-            recuse = []
+def candidate_voting(results,candidate,tally,altjurors,altchoices,offset):
 
-        # determine voting jurors for this candidate by picking altjuror if any recusals
-        if len(recuse) > len(thisjurors)-numrequired:
-            
-            # there are a lot of recusals or AWOL voting jurors, just use all jurors possible
-            print('cand '+candidate+' : not enough jurors')
-            thisvoting = [x for x in thisjurors if x not in recuse]
-            
-        elif set(voting).intersection(set(recuse)):
-            
-            # there are recusals and there are enough alternates
-            if len(thisaltjurors) == 1:
-                thisvoting = [x for x in voting if x not in recuse and x in thisjurors] + thisaltjurors
-                if len(thisvoting) < numrequired:
-                    print('cand '+candidate+' : not enough jurors')
-
-            elif len(thisaltjurors) > 1:
-                thisvoting = [x for x in voting if x not in recuse and x in thisjurors] + [thisaltjurors[altchoices[0]]]
-                if len(thisvoting) < numrequired:
-                    thisvoting.append(altjurors[1+altchoices[0] % 2])
-                    
-            else:
-                thisvoting = [x for x in voting if x not in recuse and x in thisjurors]
+    # voting jurors, their pass/fail counts and the required and repertoire piece picks for one candidate,
+    #    from results store and the candidate's tally_votes dictionary; prints alerts
+    # altchoices[offset] is the next random choice of alternate juror not used by an earlier candidate
+    # returns (voting summary entry, True if this candidate used up that choice)
 
-            if altchoices:
-                altchoices = altchoices[1:]
+    # check which jurors marked this candidate
+    cid = results.candid[candidate]
+    thisjurors = [results.jurors[jid] for jid in results.passes[cid]+results.fails[cid]]
+    thisaltjurors = [x for x in altjurors if x in thisjurors]
+    consumed = False
 
-        else:
-            
-            # in effect there are no recusals
-            thisvoting = [juror for juror in voting if juror in thisjurors]
-
-            # but if there are not enough voting jurors, still have to use alternates
-            if numrequired != len(thisvoting):
-                okaltjurors = [x for x in thisaltjurors if x not in recuse]
-                if numrequired-len(thisvoting) >= len(okaltjurors):
-                    thisvoting += okaltjurors
-                else:
-                    thisvoting += okaltjurors[altchoices[0]]
+    # check for juror recusals
+    if candidate in conflict.keys():
+        recuse = conflict[candidate]
+    else:
+        recuse = []
 
+    # determine voting jurors for this candidate by picking altjuror if any recusals
+    if len(recuse) > len(thisjurors)-numrequired:
+        
+        # there are a lot of recusals or AWOL voting jurors, just use all jurors possible
+        print('cand '+candidate+' : not enough jurors')
+        thisvoting = [x for x in thisjurors if x not in recuse]
+        
+    elif set(voting).intersection(set(recuse)):
+        
+        # there are recusals and there are enough alternates
+        if len(thisaltjurors) == 1:
+            thisvoting = [x for x in voting if x not in recuse and x in thisjurors] + thisaltjurors
             if len(thisvoting) < numrequired:
                 print('cand '+candidate+' : not enough jurors')
 
-            if altchoices:
-                altchoices = altchoices[1:]
-            
+        elif len(thisaltjurors) > 1:
+            thisvoting = [x for x in voting if x not in recuse and x in thisjurors] + [thisaltjurors[altchoices[offset]]]
+            if len(thisvoting) < numrequired:
+                thisvoting.append(altjurors[1+altchoices[offset] % 2])
+                
+        else:
+            thisvoting = [x for x in voting if x not in recuse and x in thisjurors]
 
-        # store vote tallies
-        numpass = len([x for x in results[candidate]['pass'] if x in thisvoting])
-        numfail = len([x for x in results[candidate]['fail'] if x in thisvoting])
-        votingsummary[candidate] = {'pass/fail':[numpass,numfail],'voting':thisvoting}
+        consumed = offset < len(altchoices)
 
-        # count required piece votes
-        # select piece with most votes, unless there is a tie
-        reqcountvotes = [[piece,len(results[candidate]['required'][piece])] for piece in results[candidate]['required'].keys()]
+    else:
         
-        if reqcountvotes:
-            reqselect = max(reqcountvotes,key=lambda pair:pair[1])
-            testreqselect = [pair[0] for pair in reqcountvotes if pair[1] == reqselect[1]]
-        else:
-            reqselect = []
-            testreqselect = []
-            
-        if len(testreqselect) > 1:
-            print('candidate '+candidate+', '+', '.join(testreqselect)+' : required piece tie vote')
-            reqpiece = ', '.join(testreqselect)+' (tie)'
-        else:
-            try:
-                reqpiece = reqselect[0]
-            except:
-                reqpiece = ''
-
-        votingsummary[candidate]['reqpiece'] = reqpiece
-
-        # count repertoire piece votes
-        # weighting 3 points for 1st choice, 2 for 2nd choice, 1 for 3rd choice
-        # select piece with most points, unless there is a tie
-        thisrepdict = results[candidate]['repertoire']
-        for piece in thisrepdict.keys():
-            if 1 not in thisrepdict[piece].keys():
-                thisrepdict[piece][1] = []
-            if 2 not in thisrepdict[piece].keys():
-                thisrepdict[piece][2] = []
-            if 3 not in thisrepdict[piece].keys():
-                thisrepdict[piece][3] = []
-                
-        repcountvotes = [[piece,len(thisrepdict[piece][1])*3
-                          +len(thisrepdict[piece][2])*2
-                          +len(thisrepdict[piece][3])] for piece in thisrepdict.keys()]
+        # in effect there are no recusals
+        thisvoting = [juror for juror in voting if juror in thisjurors]
+
+        # but if there are not enough voting jurors, still have to use alternates
+        if numrequired != len(thisvoting):
+            okaltjurors = [x for x in thisaltjurors if x not in recuse]
+            if numrequired-len(thisvoting) >= len(okaltjurors):
+                thisvoting += okaltjurors
+            else:
+                thisvoting += okaltjurors[altchoices[offset]]
 
-        if repcountvotes:
-            repselect = max(repcountvotes,key=lambda pair:pair[1])
-            testrepselect = [pair[0] for pair in repcountvotes if pair[1] == repselect[1]]
-        else:
-            repselect = []
-            testrepselect = []
+        if len(thisvoting) < numrequired:
+            print('cand '+candidate+' : not enough jurors')
+
+        consumed = offset < len(altchoices)
         
-        if len(testrepselect) > 1:
-            print('candidate '+candidate+' -- '+', '.join(testrepselect)+' : repertoire piece tie vote')
-            reppiece = ', '.join(testrepselect)+' (tie)'
-        else:
-            try:
-                reppiece = repselect[0]
-            except:
-                reppiece = ''
 
-        votingsummary[candidate]['reppiece'] = reppiece
+    # store vote tallies, counting marks of voting jurors only
+    votingmask = [juror in thisvoting for juror in results.jurors]
+    numpass = sum(count for count,isvoting in zip(tally['pass'],votingmask) if isvoting)
+    numfail = sum(count for count,isvoting in zip(tally['fail'],votingmask) if isvoting)
+    entry = {'pass/fail':[numpass,numfail],'voting':thisvoting}
+
+    # select required piece with most votes, unless there is a tie
+    testreqselect = tally['reqpieces']
+    if len(testreqselect) > 1:
+        print('candidate '+candidate+', '+', '.join(testreqselect)+' : required piece tie vote')
+        reqpiece = ', '.join(testreqselect)+' (tie)'
+    elif testreqselect:
+        reqpiece = testreqselect[0]
+    else:
+        reqpiece = ''
 
-        if abs(numpass-numfail) <= 1 or 'prelim' not in labelstr:
-            make_candidate_pdf(candidate,thisjurors)
+    entry['reqpiece'] = reqpiece
+
+    # select repertoire piece with most points, unless there is a tie
+    testrepselect = tally['reppieces']
+    if len(testrepselect) > 1:
+        print('candidate '+candidate+' -- '+', '.join(testrepselect)+' : repertoire piece tie vote')
+        reppiece = ', '.join(testrepselect)+' (tie)'
+    elif testrepselect:
+        reppiece = testrepselect[0]
+    else:
+        reppiece = ''
+
+    entry['reppiece'] = reppiece
+
+    return entry,consumed
+
+
+def make_jurorsummary(results,jurors,voting,conflicts,formindex,candidate_pdfs=True,jobs=1,started=None):
+
+    # construct summary of overall grades for committee reference, from results store
+    # without candidate_pdfs, the combined adjudications for each candidate aren't made
+    # with jobs > 1, the combined adjudications are made in a process pool while the summary is put together
+    # started is {candidate:(formnames, future)} of combined adjudications already under way (see pipeline_forms);
+    #    those made from the same forms as needed here are kept, the others made again
+
+    # find nonvoting jurors, set up random choice of one for each candidate
+    altjurors,altchoices = alternate_choices()
+    offset = 0
+
+    votingsummary = {}
+
+    # pass/fail counts per juror and required/repertoire piece choices, for all candidates
+    tallies = dict(zip(results.candidates,tally_votes(results)))
+
+    if candidate_pdfs and jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        pooled = ProcessPoolExecutor(max_workers=jobs)
+    else:
+        pooled = contextlib.nullcontext()
+    pdfjobs = []
+
+    with pooled as pool:
+
+        for candidate in candidates:
+
+            votingsummary[candidate],consumed = candidate_voting(results,candidate,tallies[candidate],altjurors,altchoices,offset)
+            offset += consumed
+            numpass,numfail = votingsummary[candidate]['pass/fail']
+
+            if candidate_pdfs and (abs(numpass-numfail) <= 1 or 'prelim' not in labelstr):
+                cid = results.candid[candidate]
+                thisjurors = [results.jurors[jid] for jid in results.passes[cid]+results.fails[cid]]
+                formnames = candidate_forms(candidate,thisjurors,formindex)
+                if started and candidate in started:
+                    startednames,job = started.pop(candidate)
+                    if startednames == formnames:
+                        pdfjobs.append(job)
+                        continue
+                    # made from the wrong forms; let it finish before writing the file again
+                    job.result()
+                if pool:
+                    pdfjobs.append(pool.submit(make_candidate_pdf,candidate,formnames))
+                else:
+                    for error in make_candidate_pdf(candidate,formnames):
+                        print(error)
+
+        # errors from the pool are printed in candidate order once all combined adjudications are made
+        for job in pdfjobs:
+            for error in job.result():
+                print(error)
+
+    write_jurorsummary(votingsummary)
+
+    return votingsummary
+
+
+def write_jurorsummary(votingsummary):
+
+    # write voting summary .json and LaTeX summary of all candidates, and compile the summary in the background
 
-            
     with open(examyear+'votingsummary.json','w') as fh:
         json.dump(votingsummary,fh,indent=4,sort_keys=True)
 
@@ -638,94 +1257,122 @@ def make_jurorsummary(results,jurors,voting,conflicts):
         for line in votelines:
             _ = fh.write(line)
 
-    subprocess.run('pdflatex '+votefile+' > pdflatex.out',shell=True)
+    # compile in the background; skipped if the .tex is unchanged since the last run
+    pdflatex_runner.run_pdflatex(votefile,'pdflatex.out')
 
 
-def make_candidate_pdf(candidate,thisjurors):
+def candidate_forms(candidate,thisjurors,formindex):
 
-    # create pdf of all adjudications for juror review
+    # adjudication form filenames for this candidate from each of thisjurors, flagging those not found
 
-    composer = ''
+    formnames = []
     for juror in thisjurors:
         
-        filelist = insensitive_glob('*'+juror+'*docx')
-        thisformname = [form for form in filelist if 'candidate'+candidate+'_' in form]
+        thisformname = indexed_forms(formindex,juror,'adjudication',candidate)
 
         if not thisformname:
             print('cand '+candidate+'/'+juror+' : strange name for form?')
-            thisformname = ''
-            
         else:
-            thisform = Document(thisformname[0])
-            numpar = len(thisform.paragraphs)
-            for ind in range(numpar):
-                par = thisform.paragraphs[ind]
-                if 'Juror' in par.text and 'Signature' in par.text:
+            formnames.append(thisformname[0])
+
+    return formnames
+
+
+def make_candidate_pdf(candidate,formnames):
+
+    # create pdf of all adjudications for juror review
+    # runs in a worker process with --jobs; returns list of error messages for the caller to print
+
+    errors = []
+    composer = ''
+    for formname in formnames:
+
+        thisform = Document(formname)
+        paragraphs = thisform.paragraphs
+        numpar = len(paragraphs)
+        for ind,par in enumerate(paragraphs):
+            if 'Juror' in par.text and 'Signature' in par.text:
+                run = par.add_run()
+                run.add_break(WD_BREAK.PAGE)
+            if ind == numpar-1:
+                if len(par.runs) != 0:
                     run = par.add_run()
                     run.add_break(WD_BREAK.PAGE)
-                if ind == numpar-1:
-                    if len(par.runs) != 0:
-                        run = par.add_run()
-                        run.add_break(WD_BREAK.PAGE)
-            if not composer:
-                composer = Composer(thisform)
-            else:
-                try:
-                    composer.append(thisform)
-                except:
-                    print(thisformname[0]+' error in make_candidate_pdf composer.append')
+        if not composer:
+            composer = Composer(thisform)
+        else:
+            try:
+                composer.append(thisform)
+            except:
+                errors.append(formname+' error in make_candidate_pdf composer.append')
 
     composer.save(examyear+'_candidate'+candidate+'_all.docx')
     #convert(examyear+'_candidate'+candidate+'_all.docx')
+
+    return errors
     
 
-def make_boardsummary(results):
+def make_boardsummary(results,lines=None):
 
     # create csv for board convenience
+    # lines is {candidate:[csv lines]} already made for some candidates (see watch_forms); the others are made here
 
     csvlist = ['candidate,piece,'+','.join(jurors)+',,overall,'+','.join(jurors)]
     #csvlist = ['candidate,piece,'+','.join(jurors)+',range,avg,,overall,'+','.join(jurors)]
 
     for candidate in candidates:
+        if lines and candidate in lines:
+            csvlist += lines[candidate]
+        else:
+            csvlist += board_lines(results,candidate)
 
-        overallstr = ''
+    with open(examyear+'_'+labelstr+'_exam_grade_summary.csv','w') as fh:
+        for line in csvlist:
+            _ = fh.write(line+'\n')
 
-        pieces = [key for key in results[candidate].keys() if key not in ['pass','fail','required','repertoire']]
-        for piece in pieces:
-            
-            thisline = candidate + ',' + piece.replace(',','') + ','
-            
-            for juror in jurors:
-                if juror in results[candidate][piece].keys():
-                    thisline += str(results[candidate][piece][juror]) + ','
-                else:
-                    thisline += '0,'
-                    
-            #thispiecegrades = [v for k,v in results[candidate][piece].items() if v != 0]
-            #if thispiecegrades:
-            #    graderange = max(thispiecegrades) - min(thispiecegrades)
-            #    gradeavg = sum(thispiecegrades)/len(thispiecegrades)
-            #else:
-            #    graderange = 0
-            #    gradeavg = 0
-            #    
-            #thisline += str(graderange) + ',' + '{:4.2f}'.format(gradeavg) + ','*(len(jurors)+2)
-            thisline += ','*(len(jurors)+1)
-            csvlist.append(thisline)
 
+def board_lines(results,candidate):
+
+    # csv lines of board summary for one candidate: a line per piece, the last one with overall marks
+
+    csvlist = []
+    overallstr = ''
+
+    pieces = [key for key in results[candidate].keys() if key not in ['pass','fail','required','repertoire']]
+    for piece in pieces:
+        
+        thisline = candidate + ',' + piece.replace(',','') + ','
+        
         for juror in jurors:
-            if juror in results[candidate]['pass']:
-                overallstr += ',P'
-            elif juror in results[candidate]['fail']:
-                overallstr += ',F'
+            if juror in results[candidate][piece].keys():
+                thisline += str(results[candidate][piece][juror]) + ','
             else:
-                overallstr += ','
+                thisline += '0,'
+                
+        #thispiecegrades = [v for k,v in results[candidate][piece].items() if v != 0]
+        #if thispiecegrades:
+        #    graderange = max(thispiecegrades) - min(thispiecegrades)
+        #    gradeavg = sum(thispiecegrades)/len(thispiecegrades)
+        #else:
+        #    graderange = 0
+        #    gradeavg = 0
+        #    
+        #thisline += str(graderange) + ',' + '{:4.2f}'.format(gradeavg) + ','*(len(jurors)+2)
+        thisline += ','*(len(jurors)+1)
+        csvlist.append(thisline)
+
+    for juror in jurors:
+        if juror in results[candidate]['pass']:
+            overallstr += ',P'
+        elif juror in results[candidate]['fail']:
+            overallstr += ',F'
+        else:
+            overallstr += ','
 
-        csvlist[-1] = csvlist[-1].replace(','*(len(jurors)+2),',,'+overallstr)    
-        
-    with open(examyear+'_'+labelstr+'_exam_grade_summary.csv','w') as fh:
-        for line in csvlist:
-            _ = fh.write(line+'\n')
+    if csvlist:
+        csvlist[-1] = csvlist[-1].replace(','*(len(jurors)+2),',,'+overallstr)
+
+    return csvlist
         
 
         
@@ -733,80 +1380,562 @@ def make_boardsummary(results):
 #### Main module     
 ##########################################
 
-# set up results dictionaries
-results = {}
-for candidate in candidates:
-    results[candidate] = {'pass':[],'fail':[],'required':{},'repertoire':{}}
+def read_forms(formindex,oldcache,newcache,jobs=1,preread=None,keep=None):
+
+    # read all juror forms in formindex into a results store, printing alerts as each form is recorded
+    # forms with records in oldcache aren't read again; all records used are put in newcache
+    # preread is {filename:record} of forms the caller has read already, and put in newcache (see pipeline_forms)
+    # keep, if given, is filled with {filename:record} of all forms recorded (see watch_forms)
+
+    preread = preread or {}
+    if keep is None:
+        keep = {}
+
+    # set up results store
+    results = ResultsStore(candidates,jurors)
+
+    adjfilelists = {juror:indexed_forms(formindex,juror,'adjudication') for juror in jurors}
+
+    allfiles = [filename for juror in jurors for filename in adjfilelists[juror]]
+    digests = {}
+    records = {}
+    for filename in allfiles:
+        if filename in preread:
+            records[filename] = preread[filename]
+            continue
+        digests[filename],cached = cached_record(oldcache,newcache,filename,'adjudication')
+        if cached is not None:
+            records[filename] = AdjRecord(filename,cached[0],tuple(cached[1]),tuple(cached[2]),tuple(cached[3]),cached[4])
+
+    # read the other adjudication forms, spread over a process pool if jobs > 1
+    # records are then recorded in juror, then file order, exactly as in a serial run
+    toread = list(dict.fromkeys(filename for filename in allfiles if filename not in records))
+    if jobs > 1 and len(toread) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        pooled = ProcessPoolExecutor(max_workers=jobs)
+    else:
+        pooled = contextlib.nullcontext()
 
-# go through all forms for each juror
-for juror in jurors:
+    with pooled as pool:
+        newrecords = (pool.map if pool else map)(load_adjrecord,toread)
 
-    print(juror+' : ')
+        for filename,record in zip(toread,newrecords):
+            records[filename] = record
+            store_record(newcache,digests[filename],'adjudication',list(record[1:]))
 
-    # get list of this juror's forms
-    filelist = insensitive_glob('*'+juror+'*docx')
+    # go through all forms for each juror
+    for juror in jurors:
 
-    # first deal with adjudication forms
-    adjfilelist = [x for x in filelist if x and 'prelim' not in x and 'repertoire' not in x and 'required' not in x]
+        print(juror+' : ')
 
-    # keep track of candidates for which this juror submitted forms
-    thiscandlist = []
+        # keep track of candidates for which this juror submitted forms
+        thiscandlist = []
 
-    for filename in adjfilelist:
+        # first deal with adjudication forms
+        for filename in adjfilelists[juror]:
 
-        # extract grades from adjudication form
-        adjform = Document(filename)
+            record = records[filename]
+            candidate = record.candidate
+            thiscandlist.append(candidate)
+            print(candidate,end=' ')
 
-        candidate = get_candnumber(adjform)
-        thiscandlist.append(candidate)
-        print(candidate,end=' ')
-        pieces = get_pieces(adjform)
-        reqlist = get_req(adjform)
-        grades = get_pf_grades(adjform)
-        overall = get_overall(adjform)
+            # store individual piece grades in results
+            results = record_grades(results,record,juror)
 
-        thisdict = copy.deepcopy(results[candidate])
+            # check for overall pass/fail and consistency
+            results = record_overall(results,record,juror)
+            keep[filename] = record
 
-        # store individual piece grades in results
-        thisdict = record_grades(thisdict,pieces,grades)
-        
-        # check for overall pass/fail and consistency
-        req_outcomes = [grades[ind]*reqlist[ind] for ind in range(len(pieces))]
-        thisdict = record_overall(thisdict,overall,req_outcomes)
+        print('')
 
-        results[candidate] = thisdict
+        missingcands = [x for x in candidates if x not in thiscandlist]
+        if missingcands:
+            print('missing form(s) for '+', '.join(missingcands)+' !')
 
-    print('')
+        # deal with repertoire form
+        repfile = indexed_forms(formindex,juror,'repertoire')
 
-    missingcands = [x for x in candidates if x not in thiscandlist]
-    if missingcands:
-        print('missing form(s) for '+', '.join(missingcands)+' !')
-        
-    # deal with repertoire form
-    repfile = [x for x in filelist if 'repertoire' in x]
-    
-    if repfile:
-        repform = Document(repfile[0])
-        # extract values from table in repertoire form and store in dictionary
-        results = record_repvotes(repform,results,juror)
+        if repfile and repfile[0] in preread:
+            results = record_repvotes(preread[repfile[0]],results,juror)
+            keep[repfile[0]] = preread[repfile[0]]
+        elif repfile:
+            digest,repvotes = cached_record(oldcache,newcache,repfile[0],'repertoire')
+            if repvotes is None:
+                # extract values from table in repertoire form
+                repvotes = read_repvotes(Document(repfile[0]))
+                store_record(newcache,digest,'repertoire',repvotes)
+            results = record_repvotes(repvotes,results,juror)
+            keep[repfile[0]] = repvotes
+        else:
+            print("can't find repertoire piece form")
+
+        # deal with required piece form
+        reqfile = indexed_forms(formindex,juror,'required')
+
+        if reqfile and reqfile[0] in preread:
+            results = record_reqvotes(preread[reqfile[0]],results,juror)
+            keep[reqfile[0]] = preread[reqfile[0]]
+        elif reqfile:
+            digest,reqvotes = cached_record(oldcache,newcache,reqfile[0],'required')
+            if reqvotes is None:
+                # extract pieces and choices from required form
+                reqvotes = read_reqvotes(Document(reqfile[0]))
+                store_record(newcache,digest,'required',reqvotes)
+            results = record_reqvotes(reqvotes,results,juror)
+            keep[reqfile[0]] = reqvotes
+        else:
+            print("can't find required piece form")
+
+    return results
+
+
+def write_results(results,formindex,candidate_pdfs=True,jobs=1,dbfile='',started=None):
+
+    # write voting summary, board summary and results<year>.json from results store
+    # without candidate_pdfs, the combined adjudications for each candidate aren't made
+    # with jobs > 1, they are made in a process pool; started as for make_jurorsummary
+    # with dbfile, this cycle's results are also stored in that database (see results_db.py)
+
+    # create summaries of overall scores
+    votingsummary = make_jurorsummary(results,jurors,voting,conflict,formindex,candidate_pdfs,jobs,started)
+
+    required = results.required_pieces()
+
+    # results dictionary for the board summary and results<year>.json
+    results = results.to_dict()
+
+    make_boardsummary(results)
+
+    with open('results'+examyear+'.json','w') as fh:
+        json.dump(results,fh,indent=4,sort_keys=True)
+
+    if dbfile:
+        import results_db
+        results_db.store_cycle(dbfile,examyear,labelstr,jurors,voting,results,votingsummary,required,candidate_ids)
+
+
+def candidate_marks(candidate,adjfilelists,records):
+
+    # jurors who marked candidate overall pass, then fail, in the order read_forms records them,
+    #    from the records of the forms in adjfilelists ({juror:[filenames]}) read so far
+
+    marks = [(juror,records[filename].overall) for juror in jurors for filename in adjfilelists[juror]
+             if filename in records and records[filename].candidate == candidate]
+
+    return [juror for juror,overall in marks if overall == 'pass'] + [juror for juror,overall in marks if overall == 'fail']
+
+
+async def pipeline_forms(formindex,oldcache,newcache,cachefile,jobs=1,dbfile=''):
+
+    # read all juror forms and write the results as read_forms and write_results do, overlapping the stages:
+    # -- the contents of forms not in the parse cache are read from disk a few forms ahead of parsing
+    # -- forms are parsed in worker threads (processes, if jobs > 1), candidate by candidate
+    # -- each candidate's combined adjudications are started as soon as all forms named for that candidate
+    #    are parsed (for 'final' results, which make them for every candidate); if the finished records
+    #    call for other forms, they are made again
+    # -- pdflatex runs as an asyncio subprocess while the other summaries are written
+    # the results, summaries and printed alerts are those of a serial run
+
+    import asyncio
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    loop = asyncio.get_running_loop()
+    pdflatex_runner.use_event_loop(loop)
+
+    if jobs > 1:
+        workers = ProcessPoolExecutor(max_workers=jobs)
     else:
-        print("can't find repertoire piece form")
+        workers = ThreadPoolExecutor(max_workers=2)
+    readers = ThreadPoolExecutor(max_workers=2)
+    readahead = asyncio.Semaphore(2*max(jobs,2))
+
+    # adjudication forms candidate by candidate (as named), so candidates are ready in turn; then the vote forms
+    adjfilelists = {juror:indexed_forms(formindex,juror,'adjudication') for juror in jurors}
+    adjfiles = list(dict.fromkeys(filename for juror in jurors for filename in adjfilelists[juror]))
+    adjfiles.sort(key=lambda filename:int(form_candidate(filename) or 0))
+    forms = [(filename,'adjudication') for filename in adjfiles]
+    for kind in ['repertoire','required']:
+        forms += [(filename,kind) for filename in dict.fromkeys(
+                  filename for juror in jurors for filename in indexed_forms(formindex,juror,kind)[:1])]
+
+    # adjudication forms still to be parsed, by candidate named in the filename (None if not named)
+    waiting = {}
+    for filename in adjfiles:
+        waiting[form_candidate(filename)] = waiting.get(form_candidate(filename),0) + 1
+
+    preread = {}
+    started = {}
+    early = 'prelim' not in labelstr
+
+    def start_candidate_pdf(candidate):
+        formnames = [names[0] for names in (indexed_forms(formindex,juror,'adjudication',candidate)
+                                            for juror in candidate_marks(candidate,adjfilelists,preread)) if names]
+        if formnames:
+            started[candidate] = (formnames,workers.submit(make_candidate_pdf,candidate,formnames))
+
+    def adjform_done(filename):
+        candidate = form_candidate(filename)
+        waiting[candidate] -= 1
+        if not early or waiting.get(None,0):
+            return
+        for cand in ([candidate] if candidate is not None else list(waiting)):
+            if cand in candidates and not waiting[cand] and cand not in started:
+                start_candidate_pdf(cand)
+
+    def read_bytes(filename):
+        with open(filename,'rb') as fh:
+            return fh.read()
+
+    async def read_form(filename,kind):
+        async with readahead:
+            data = None
+            if cached_digest(oldcache,filename,os.stat(filename)) is None:
+                data = await loop.run_in_executor(readers,read_bytes,filename)
+            digest,record = cached_record(oldcache,newcache,filename,kind,data)
+            if record is None:
+                if data is None:
+                    data = await loop.run_in_executor(readers,read_bytes,filename)
+                record = await loop.run_in_executor(workers,load_form,kind,filename,data)
+                store_record(newcache,digest,kind,list(record[1:]) if kind == 'adjudication' else record)
+            elif kind == 'adjudication':
+                record = AdjRecord(filename,record[0],tuple(record[1]),tuple(record[2]),tuple(record[3]),record[4])
+        preread[filename] = record
+        if kind == 'adjudication':
+            adjform_done(filename)
+
+    try:
+        await asyncio.gather(*[read_form(filename,kind) for filename,kind in forms])
+
+        # recording is quick, and prints the alerts in the same order as a serial run
+        results = read_forms(formindex,oldcache,newcache,jobs,preread)
+
+        # keep records of this run's forms for the next run
+        with open(cachefile,'w') as fh:
+            json.dump(newcache,fh)
+
+        # summaries are written in a thread, so pdflatex can start on the event loop meanwhile
+        await loop.run_in_executor(None,lambda: write_results(results,formindex,jobs=jobs,dbfile=dbfile,started=started))
+
+        await pdflatex_runner.wait_pdflatex_async()
+
+    finally:
+        pdflatex_runner.use_event_loop(None)
+        workers.shutdown()
+        readers.shutdown()
+
+
+def form_snapshot(dirname='.'):
+
+    # size and mtime of every .docx file in directory
+
+    snapshot = {}
+    for entry in os.scandir(dirname):
+        if entry.name.lower().endswith('docx') and not entry.name.startswith(('.','~$')):
+            stat = entry.stat()
+            snapshot[entry.name] = (stat.st_size,stat.st_mtime_ns)
+
+    return snapshot
+
+
+def read_record(oldcache,newcache,filename,kind):
+
+    # record read from juror form of this kind, from oldcache if a file with the same contents was read before
+    # the record is put in newcache either way
 
-    # deal with required piece form
-    reqfile = [x for x in filelist if 'required' in x]
+    digest,record = cached_record(oldcache,newcache,filename,kind)
+    if record is None:
+        record = load_form(kind,filename)
+        store_record(newcache,digest,kind,list(record[1:]) if kind == 'adjudication' else record)
+    elif kind == 'adjudication':
+        record = AdjRecord(filename,record[0],tuple(record[1]),tuple(record[2]),tuple(record[3]),record[4])
 
-    if reqfile:
-        reqform = Document(reqfile[0])
-        # extract pieces and choices from required form and store in dictionary
-        results = record_reqvotes(reqform,results,juror)
+    return record
+
+
+def record_candidates(record,other=None):
+
+    # candidates a form record has marks for: that of an adjudication form, all those on a repertoire or required
+    #    piece form; with other, the record of the same form before it changed, only those whose marks differ
+
+    if isinstance(record,AdjRecord):
+        if other is None:
+            return set([record.candidate])
+        if record[1:] == other[1:]:
+            return set()
+        return set([record.candidate,other.candidate])
+
+    rows = set(tuple(row) for row in record)
+    if other is None:
+        return set(row[0] for row in rows)
+
+    otherrows = set(tuple(row) for row in other)
+    return set(row[0] for row in rows ^ otherrows)
+
+
+def update_summaries(results,summaries,touched):
+
+    # bring summaries up to date for the candidates in touched, whose records in results store changed
+    # summaries is {'results':{candidate:results dictionary}, 'board':{candidate:[board summary csv lines]},
+    #    'voting':{candidate:voting summary entry}, 'offsets':{candidate:(alternate choice offset, used it)}};
+    #    all candidates are filled in when touched holds them all
+    # a candidate's voting jurors also depend on which earlier candidates used up a random choice of alternate juror,
+    #    so later candidates are worked out again where that changed
+    # returns True if any voting summary entry changed
+
+    altjurors,altchoices = summaries['alternates']
+
+    for candidate in touched:
+        summaries['results'][candidate] = results.candidate_dict(results.candid[candidate])
+        summaries['board'][candidate] = board_lines(summaries['results'],candidate)
+
+    changed = False
+    offset = 0
+    for candidate in candidates:
+        if candidate in touched or summaries['offsets'][candidate][0] != offset:
+            tally = tally_votes(results,[results.candid[candidate]])[0]
+            entry,consumed = candidate_voting(results,candidate,tally,altjurors,altchoices,offset)
+            changed = changed or entry != summaries['voting'].get(candidate)
+            summaries['voting'][candidate] = entry
+            summaries['offsets'][candidate] = (offset,consumed)
+        offset += summaries['offsets'][candidate][1]
+
+    return changed
+
+
+def watch_state(cache):
+
+    # form index, form records, results store and summaries of all forms, as watch_forms keeps them between updates,
+    #    from records in cache (or read from the forms, if not there), printing alerts as read_forms does
+
+    formindex = index_forms(jurors)
+    records = {}
+    results = read_forms(formindex,cache,cache,keep=records)
+
+    summaries = {'results':{},'board':{},'voting':{},'offsets':{candidate:(None,False) for candidate in candidates},
+                 'alternates':alternate_choices()}
+    _ = update_summaries(results,summaries,set(candidates))
+
+    return formindex,records,results,summaries
+
+
+def watch_update(cache,state,changed):
+
+    # read changed forms (names in changed) into watch_forms' state, record them again with the other forms
+    #    for the candidates they have marks for, and rewrite the summaries and results of those candidates
+    # returns candidates updated
+
+    formindex,records,results,summaries = state
+    changed = set(changed)
+
+    # forms changed, added or removed, and the candidates their old and new records are for
+    newindex = index_forms(jurors)
+    touched = set()
+    changedjurors = set()
+    for key in list(formindex)+[key for key in newindex if key not in formindex]:
+        oldnames = formindex.get(key,[])
+        newnames = newindex.get(key,[])
+        oldrecords = [records.pop(filename) for filename in oldnames
+                      if (filename in changed or filename not in newnames) and filename in records]
+        newnames = [filename for filename in newnames if filename not in records]
+        for filename in newnames:
+            records[filename] = read_record(cache,cache,filename,key[2])
+        if oldrecords or newnames:
+            changedjurors.add(key[0])
+        if len(oldrecords) == 1 and len(newnames) == 1:
+            # a form saved again; a juror's repertoire or required piece form covers all candidates,
+            #    most of them likely unchanged
+            touched |= record_candidates(records[newnames[0]],oldrecords[0])
+        else:
+            for record in oldrecords+[records[filename] for filename in newnames]:
+                touched |= record_candidates(record)
+
+    formindex.clear()
+    formindex.update(newindex)
+
+    # record all forms for those candidates again, in the order read_forms records them
+    touched = [candidate for candidate in candidates if candidate in touched]
+    for candidate in touched:
+        results.clear_candidate(candidate)
+    touchedset = set(touched)
+
+    for juror in jurors:
+
+        adjfiles = indexed_forms(formindex,juror,'adjudication')
+        for filename in adjfiles:
+            record = records[filename]
+            if record.candidate in touchedset:
+                results = record_grades(results,record,juror)
+                results = record_overall(results,record,juror)
+
+        if juror in changedjurors:
+            missingcands = set(candidates)-set(records[filename].candidate for filename in adjfiles)
+            if missingcands:
+                print(juror+' : missing form(s) for '+', '.join(x for x in candidates if x in missingcands)+' !')
+
+        for kind,record_votes in [('repertoire',record_repvotes),('required',record_reqvotes)]:
+            votefile = indexed_forms(formindex,juror,kind)
+            if votefile:
+                results = record_votes([row for row in records[votefile[0]] if row[0] in touchedset],results,juror)
+
+    if not touched:
+        return touched
+
+    # rewrite the summaries; a candidate's entries that didn't change are written as they were
+    if update_summaries(results,summaries,touchedset):
+        write_jurorsummary(summaries['voting'])
+    make_boardsummary(summaries['results'],summaries['board'])
+    with open('results'+examyear+'.json','w') as fh:
+        json.dump(summaries['results'],fh,indent=4,sort_keys=True)
+
+    return touched
+
+
+def watch_forms(cache,cachefile,interval,jobs=1,dbfile=''):
+
+    # poll directory every interval seconds; once new or changed forms have stopped changing
+    #    for one interval, read the changed forms and record them again with the other forms for
+    #    the candidates they are for, then rewrite the summaries and results of those candidates only
+    #    (see watch_update), without the combined adjudications for each candidate or the database
+    # on ctrl-C, record all forms and write everything once more, including the combined adjudications
+    #    and the database
+
+    print('watching for new or changed forms every '+str(interval)+' s, ctrl-C to stop')
+
+    lastread = form_snapshot()
+    lastseen = lastread
+
+    # the first pass has just printed its alerts; build the state from its records without printing them again
+    with contextlib.redirect_stdout(io.StringIO()):
+        state = watch_state(cache)
+
+    try:
+        while True:
+            time.sleep(interval)
+
+            snapshot = form_snapshot()
+            if snapshot != lastseen:
+                # still changing, wait for it to settle
+                lastseen = snapshot
+                continue
+            if snapshot == lastread:
+                continue
+
+            changed = sorted(name for name in set(snapshot) | set(lastread) if snapshot.get(name) != lastread.get(name))
+            lastread = snapshot
+            print('')
+            print(time.strftime('%H:%M:%S')+' changed : '+', '.join(changed))
+
+            try:
+                if state is None:
+                    state = watch_state(cache)
+                    touched = candidates
+                else:
+                    touched = watch_update(cache,state,changed)
+                with open(cachefile,'w') as fh:
+                    json.dump(cache,fh)
+                print('updated candidate(s) '+', '.join(touched) if touched else 'no candidates changed')
+            except Exception as err:
+                # most likely a form saved halfway; everything is recorded again on the next change
+                print('update failed : '+repr(err))
+                state = None
+
+    except KeyboardInterrupt:
+        print('')
+        print('stopped watching, writing final summaries')
+
+    formindex = index_forms(jurors)
+    newcache = new_parsecache()
+    results = read_forms(formindex,cache,newcache,jobs)
+    with open(cachefile,'w') as fh:
+        json.dump(newcache,fh)
+    write_results(results,formindex,jobs=jobs,dbfile=dbfile)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='parse returned recording stage adjudication forms')
+    parser.add_argument('--jobs',type=int,default=1,metavar='N',
+                        help='worker processes for reading adjudication forms and combining them per candidate (0 = one per core, default 1)')
+    parser.add_argument('--no-cache',action='store_true',
+                        help='read all forms again, ignoring records cached by earlier runs')
+    parser.add_argument('--watch',type=float,nargs='?',const=5.0,metavar='SECONDS',
+                        help='after the first run, keep watching for new or changed forms and update the results '
+                             '(polling every SECONDS, default 5)')
+    parser.add_argument('--pipeline',action='store_true',
+                        help='overlap reading forms from disk, parsing them, combining adjudications and pdflatex '
+                             '(asyncio); same results as without')
+    parser.add_argument('--db',default='',metavar='FILE',
+                        help="also store this cycle's results in SQLite database FILE, for reports across cycles (see results_db.py)")
+    parser.add_argument('--profile',action='store_true',
+                        help='time stages and hot helpers, report in <examyear>_parse_profile.json')
+    parser.add_argument('--pstats',default='',metavar='FILE',
+                        help='with --profile, also save a cProfile dump of the run to FILE')
+    args = parser.parse_args(argv)
+
+    jobs = args.jobs if args.jobs > 0 else os.cpu_count()
+
+    if not (args.profile or args.pstats):
+        parse_forms(args,jobs)
+        return
+
+    start_profiling(args.pstats)
+    try:
+        parse_forms(args,jobs)
+    finally:
+        import profiling
+        profiling.finish(examyear+'_parse_profile.json','parse_adjforms',
+                         {'jobs':jobs,'no_cache':args.no_cache,'watch':args.watch,'pipeline':args.pipeline})
+
+
+def start_profiling(pstats=''):
+
+    # time parsing stages and hot helpers for --profile (see profiling.py)
+    # with --jobs, helpers run in worker processes aren't counted
+
+    import profiling
+
+    profiling.start(pstats)
+    profiling.instrument(globals(),['index_forms','read_forms','write_results','make_jurorsummary','make_boardsummary'],'stage')
+    profiling.instrument(globals(),['load_form','load_adjrecord','read_fast_form','read_adjrecord','get_pf_grade','get_overall',
+                                    'read_repvotes','read_reqvotes','record_repvotes','record_reqvotes',
+                                    'candidate_forms','make_candidate_pdf','Document'])
+    profiling.instrument(Composer,['append','save'],prefix='Composer.')
+    profiling.instrument(pdflatex_runner,['run_pdflatex','compile_tex','wait_pdflatex'],prefix='pdflatex_runner.')
+
+
+def parse_forms(args,jobs):
+
+    # read all returned forms and write the results, then keep watching if asked
+
+    # find each juror's forms, in one scan of the directory
+    formindex = index_forms(jurors)
+
+    # records read on earlier runs from files with the same contents are reused
+    cachefile = examyear+'_parsecache.json'
+    if args.no_cache:
+        oldcache = new_parsecache()
     else:
-        print("can't find required piece form")
-    
+        oldcache = load_parsecache(cachefile)
+    newcache = new_parsecache()
+
+    if args.pipeline:
+        import asyncio
+        asyncio.run(pipeline_forms(formindex,oldcache,newcache,cachefile,jobs,args.db))
+    else:
+        results = read_forms(formindex,oldcache,newcache,jobs)
+
+        # keep records of this run's forms for the next run
+        with open(cachefile,'w') as fh:
+            json.dump(newcache,fh)
+
+        write_results(results,formindex,jobs=jobs,dbfile=args.db)
+
+    pdflatex_runner.wait_pdflatex()
 
-# create summaries of overall scores
-make_jurorsummary(results,jurors,voting,conflict)
+    if args.watch:
+        watch_forms(newcache,cachefile,args.watch,jobs,args.db)
+        pdflatex_runner.wait_pdflatex()
 
-make_boardsummary(results)
 
-with open('results'+examyear+'.json','w') as fh:
-    json.dump(results,fh,indent=4,sort_keys=True)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,196 @@
+'''
+Run pdflatex on the .tex files made by create_adjforms.py and parse_adjforms.py
+-- skip compiling if the .tex is unchanged since its last successful compile and the pdf is still there
+-- compile in a temporary directory, in nonstopmode and with a timeout
+-- compile in the background, so the calling script can carry on meanwhile
+-- or, once use_event_loop() has been called, as asyncio subprocesses on that event loop
+
+Keep this file in the same directory as create_adjforms.py and parse_adjforms.py.
+
+
+USAGE (from the scripts):
+
+job = pdflatex_runner.run_pdflatex('2022_candidate_programs.tex','pdflatex.log')
+...
+pdflatex_runner.wait_pdflatex()
+
+or, from a coroutine running on an asyncio event loop:
+
+pdflatex_runner.use_event_loop(asyncio.get_running_loop())
+job = pdflatex_runner.run_pdflatex('2022_final_recording_summary.tex','pdflatex.out')    # from any thread
+...
+await pdflatex_runner.wait_pdflatex_async()
+pdflatex_runner.use_event_loop(None)
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+
+
+# seconds before giving up on a single pdflatex run
+timeout = 120
+
+# compilations run in these background threads; the interpreter waits for them before exiting
+executor = ThreadPoolExecutor(max_workers=2)
+pending = []
+
+# event loop to compile on instead, set by use_event_loop()
+loop = None
+
+
+def tex_digest(texfile):
+
+    # sha256 of the .tex source
+
+    with open(texfile,'rb') as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
+
+
+def stamp_name(texfile):
+
+    # file recording the digest of the .tex source behind the current pdf
+
+    return os.path.splitext(texfile)[0]+'.texhash'
+
+
+def compile_tex(texfile,logfile,digest):
+
+    # compile texfile in a temporary directory and move the pdf next to texfile
+    # returns 'compiled' or 'failed'
+
+    texname = os.path.basename(texfile)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+
+        shutil.copy(texfile,os.path.join(tmpdir,texname))
+
+        try:
+            with open(logfile,'w') as fh:
+                proc = subprocess.run(['pdflatex','-interaction=nonstopmode','-halt-on-error',texname],
+                                      cwd=tmpdir,stdin=subprocess.DEVNULL,stdout=fh,stderr=subprocess.STDOUT,
+                                      timeout=timeout)
+            ok = proc.returncode == 0
+        except FileNotFoundError:
+            print("can't find pdflatex, "+texfile+' not compiled')
+            return 'failed'
+        except subprocess.TimeoutExpired:
+            print('pdflatex timed out on '+texfile)
+            return 'failed'
+
+        return keep_pdf(texfile,logfile,digest,tmpdir,ok)
+
+
+async def compile_tex_async(texfile,logfile,digest):
+
+    # as compile_tex, with pdflatex run as an asyncio subprocess
+
+    import asyncio
+
+    texname = os.path.basename(texfile)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+
+        shutil.copy(texfile,os.path.join(tmpdir,texname))
+
+        try:
+            with open(logfile,'w') as fh:
+                proc = await asyncio.create_subprocess_exec('pdflatex','-interaction=nonstopmode','-halt-on-error',texname,
+                                                            cwd=tmpdir,stdin=subprocess.DEVNULL,stdout=fh,
+                                                            stderr=subprocess.STDOUT)
+                try:
+                    returncode = await asyncio.wait_for(proc.wait(),timeout)
+                except asyncio.TimeoutError:
+                    proc.kill()
+                    await proc.wait()
+                    print('pdflatex timed out on '+texfile)
+                    return 'failed'
+            ok = returncode == 0
+        except FileNotFoundError:
+            print("can't find pdflatex, "+texfile+' not compiled')
+            return 'failed'
+
+        return keep_pdf(texfile,logfile,digest,tmpdir,ok)
+
+
+def keep_pdf(texfile,logfile,digest,tmpdir,ok):
+
+    # move pdf compiled in tmpdir next to texfile and record the digest of its source
+    # returns 'compiled' or 'failed'
+
+    texdir,texname = os.path.split(os.path.abspath(texfile))
+    pdfname = os.path.splitext(texname)[0]+'.pdf'
+
+    if not ok or not os.path.exists(os.path.join(tmpdir,pdfname)):
+        print('pdflatex failed on '+texfile+', see '+logfile)
+        return 'failed'
+
+    shutil.move(os.path.join(tmpdir,pdfname),os.path.join(texdir,pdfname))
+
+    with open(stamp_name(texfile),'w') as fh:
+        _ = fh.write(digest+'\n')
+
+    return 'compiled'
+
+
+def run_pdflatex(texfile,logfile='pdflatex.log',wait=False):
+
+    # start compiling texfile in the background, unless its pdf is already up to date
+    # returns a future whose result is 'cached', 'compiled' or 'failed'
+    # after use_event_loop(), compiles on that event loop; may then be called from any thread but,
+    #    with wait, not from the event loop's own
+
+    digest = tex_digest(texfile)
+    pdffile = os.path.splitext(texfile)[0]+'.pdf'
+
+    try:
+        with open(stamp_name(texfile),'r') as fh:
+            lastdigest = fh.read().strip()
+    except OSError:
+        lastdigest = ''
+
+    if lastdigest == digest and os.path.exists(pdffile):
+        job = executor.submit(lambda: 'cached')
+    elif loop is not None:
+        import asyncio
+        job = asyncio.run_coroutine_threadsafe(compile_tex_async(texfile,logfile,digest),loop)
+    else:
+        job = executor.submit(compile_tex,texfile,logfile,digest)
+
+    pending.append(job)
+
+    if wait:
+        job.result()
+
+    return job
+
+
+def wait_pdflatex():
+
+    # wait for all background compilations to finish
+
+    while pending:
+        pending.pop(0).result()
+
+
+def use_event_loop(newloop):
+
+    # compile on newloop (from then on), or in background threads again if None
+
+    global loop
+
+    loop = newloop
+
+
+async def wait_pdflatex_async():
+
+    # wait for all background compilations to finish, from a coroutine
+
+    import asyncio
+
+    while pending:
+        await asyncio.wrap_future(pending.pop(0))
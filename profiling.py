@@ -0,0 +1,147 @@
+'''
+Time the stages and hot helpers of create_adjforms.py and parse_adjforms.py, for their --profile option
+-- wall time, CPU time (of the calling thread) and call count of each instrumented function
+-- JSON report, and a summary table on standard output
+-- optionally, a cProfile dump of the whole run for pstats
+
+Functions are only wrapped once instrument() is called, so nothing is timed, and nothing is slowed down,
+unless --profile is given.
+
+Keep this file in the same directory as create_adjforms.py and parse_adjforms.py.
+
+
+USAGE (from the scripts):
+
+profiling.start('run.pstats')      # or start() without cProfile
+profiling.instrument(globals(),['make_adjforms','make_reqform'],'stage')
+profiling.instrument(Composer,['save'],'helper','Composer.')
+...
+profiling.finish('2022_create_profile.json','create_adjforms')
+'''
+
+import cProfile
+import functools
+import json
+import platform
+import threading
+import time
+
+
+# {name : {'kind':'stage' or 'helper', 'calls':..., 'wall_s':..., 'cpu_s':...}}
+timings = {}
+lock = threading.Lock()
+
+# set by start()
+started = None
+profiler = None
+pstatsfile = ''
+
+
+def timed(name,kind,func):
+
+    # wrap func so each call adds to timings[name]
+    # wall time includes nested calls; cpu time is that of the calling thread only
+    # a re-entrant call (func calling itself through its wrapped name, in the same thread) is part of
+    #    the outer call, so it isn't counted or timed again
+
+    with lock:
+        timings.setdefault(name,{'kind':kind,'calls':0,'wall_s':0.0,'cpu_s':0.0})
+
+    # set while a call is being timed in this thread
+    active = threading.local()
+
+    @functools.wraps(func)
+    def wrapper(*args,**kwargs):
+        if getattr(active,'timing',False):
+            return func(*args,**kwargs)
+        active.timing = True
+        start = time.perf_counter()
+        cpustart = time.thread_time()
+        try:
+            return func(*args,**kwargs)
+        finally:
+            active.timing = False
+            wall = time.perf_counter() - start
+            cpu = time.thread_time() - cpustart
+            with lock:
+                entry = timings[name]
+                entry['calls'] += 1
+                entry['wall_s'] += wall
+                entry['cpu_s'] += cpu
+
+    wrapper.profiled = True
+
+    return wrapper
+
+
+def instrument(owner,names,kind='helper',prefix=''):
+
+    # replace functions named in names with timed wrappers, reported as prefix+name
+    # owner is a module's globals() dictionary, a module or a class
+    # functions already wrapped are left alone
+
+    for name in names:
+        if isinstance(owner,dict):
+            func = owner[name]
+            if not getattr(func,'profiled',False):
+                owner[name] = timed(prefix+name,kind,func)
+        else:
+            func = getattr(owner,name)
+            if not getattr(func,'profiled',False):
+                setattr(owner,name,timed(prefix+name,kind,func))
+
+
+def start(pstats=''):
+
+    # start the clock for the whole run, and cProfile if pstats names a dump file
+
+    global started, profiler, pstatsfile
+
+    started = time.perf_counter()
+    pstatsfile = pstats
+    if pstats:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+
+def finish(reportfile,script,params=None):
+
+    # stop cProfile and write its dump, write JSON report and print summary table
+
+    global profiler
+
+    total = time.perf_counter() - started if started is not None else None
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(pstatsfile)
+        profiler = None
+
+    with lock:
+        entries = {name:dict(entry,wall_s=round(entry['wall_s'],4),cpu_s=round(entry['cpu_s'],4))
+                   for name,entry in timings.items()}
+
+    report = {'script':script,
+              'time':time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'python':platform.python_version(),
+              'platform':platform.platform(),
+              'params':params or {},
+              'total_wall_s':round(total,4) if total is not None else None,
+              'stages':{name:entry for name,entry in entries.items() if entry['kind'] == 'stage'},
+              'helpers':{name:entry for name,entry in entries.items() if entry['kind'] == 'helper'},
+              'pstats':pstatsfile}
+
+    with open(reportfile,'w') as fh:
+        json.dump(report,fh,indent=4)
+
+    print('')
+    print('%-32s %7s %10s %10s' % ('profile','calls','wall s','cpu s'))
+    for kind in ['stage','helper']:
+        for name,entry in sorted(entries.items(),key=lambda item:-item[1]['wall_s']):
+            if entry['kind'] == kind and entry['calls']:
+                print('%-32s %7d %10.3f %10.3f' % (name,entry['calls'],entry['wall_s'],entry['cpu_s']))
+    if total is not None:
+        print('%-32s %7s %10.3f' % ('total','',total))
+    print('profile saved to '+reportfile+(', cProfile dump to '+pstatsfile if pstatsfile else ''))
+
+    return report
@@ -0,0 +1,387 @@
+'''
+Keep the results of every exam cycle in one SQLite database, for reports across cycles
+-- parse_adjforms.py --db FILE stores this cycle's results on each run (replacing what was
+   stored for the same exam year before)
+-- results of earlier cycles can be loaded from their results<year>.json and <year>votingsummary.json
+-- canned queries for cross-cycle reports (juror pass rates, retakes, ...)
+
+Tables: cycles, jurors, cycle_jurors, candidates, pieces, grades (per piece and juror),
+overall (overall marks), reqvotes (required piece votes), repvotes (repertoire piece votes)
+
+Candidate numbers are only unique within a cycle; candidates are followed from one cycle to
+the next through candidates.person, filled from candidate_ids in parse_adjforms.py (or --ids).
+
+Keep this file in the same directory as parse_adjforms.py.
+
+
+USAGE:
+
+$ python3 results_db.py gcna_results.db queries
+$ python3 results_db.py gcna_results.db query juror_required [--juror lee] [--year 2022]
+$ python3 results_db.py gcna_results.db load 2021 results2021.json 2021votingsummary.json [--ids ids2021.json]
+'''
+
+import argparse
+import json
+import sqlite3
+import time
+
+
+schema = '''
+CREATE TABLE IF NOT EXISTS cycles (
+    cycle_id INTEGER PRIMARY KEY,
+    examyear TEXT NOT NULL UNIQUE,
+    label TEXT NOT NULL,
+    updated TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jurors (
+    juror_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS cycle_jurors (
+    cycle_id INTEGER NOT NULL REFERENCES cycles,
+    juror_id INTEGER NOT NULL REFERENCES jurors,
+    voting INTEGER NOT NULL,
+    PRIMARY KEY (cycle_id,juror_id)
+);
+CREATE TABLE IF NOT EXISTS candidates (
+    candidate_id INTEGER PRIMARY KEY,
+    cycle_id INTEGER NOT NULL REFERENCES cycles,
+    number TEXT NOT NULL,
+    person TEXT,
+    numpass INTEGER,
+    numfail INTEGER,
+    result TEXT,
+    reqpiece TEXT,
+    reppiece TEXT,
+    UNIQUE (cycle_id,number)
+);
+CREATE INDEX IF NOT EXISTS candidates_person ON candidates (person);
+CREATE TABLE IF NOT EXISTS pieces (
+    piece_id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS grades (
+    candidate_id INTEGER NOT NULL REFERENCES candidates,
+    piece_id INTEGER NOT NULL REFERENCES pieces,
+    juror_id INTEGER NOT NULL REFERENCES jurors,
+    grade TEXT,
+    required INTEGER,
+    PRIMARY KEY (candidate_id,piece_id,juror_id)
+);
+CREATE INDEX IF NOT EXISTS grades_juror ON grades (juror_id,required);
+CREATE INDEX IF NOT EXISTS grades_piece ON grades (piece_id);
+CREATE TABLE IF NOT EXISTS overall (
+    candidate_id INTEGER NOT NULL REFERENCES candidates,
+    juror_id INTEGER NOT NULL REFERENCES jurors,
+    mark TEXT NOT NULL,
+    voting INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS overall_candidate ON overall (candidate_id);
+CREATE INDEX IF NOT EXISTS overall_juror ON overall (juror_id);
+CREATE TABLE IF NOT EXISTS reqvotes (
+    candidate_id INTEGER NOT NULL REFERENCES candidates,
+    piece_id INTEGER NOT NULL REFERENCES pieces,
+    juror_id INTEGER NOT NULL REFERENCES jurors
+);
+CREATE INDEX IF NOT EXISTS reqvotes_candidate ON reqvotes (candidate_id);
+CREATE INDEX IF NOT EXISTS reqvotes_juror ON reqvotes (juror_id);
+CREATE INDEX IF NOT EXISTS reqvotes_piece ON reqvotes (piece_id);
+CREATE TABLE IF NOT EXISTS repvotes (
+    candidate_id INTEGER NOT NULL REFERENCES candidates,
+    piece_id INTEGER NOT NULL REFERENCES pieces,
+    juror_id INTEGER NOT NULL REFERENCES jurors,
+    choice INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS repvotes_candidate ON repvotes (candidate_id);
+CREATE INDEX IF NOT EXISTS repvotes_juror ON repvotes (juror_id);
+CREATE INDEX IF NOT EXISTS repvotes_piece ON repvotes (piece_id);
+'''
+
+# grades.grade is 'pass', 'fail', NULL if missing, or whatever else was read
+# grades.required is 1 for required pieces, 0 for repertoire pieces, NULL if not known
+#    (cycles loaded from results<year>.json don't say which pieces were required)
+# candidates.result is 'pass' or 'fail' by majority of the voting jurors' overall marks, '' if tied
+# repvotes.choice is 1, 2 or 3 for a juror's 1st, 2nd or 3rd choice of repertoire piece
+
+# canned queries, name : (description, SQL)
+# :juror and :year restrict a query to one juror name / exam year where it has a juror or year column
+queries = {
+    'cycles':('candidates, passes and fails in each cycle',
+        '''SELECT cy.examyear, cy.label, COUNT(ca.candidate_id) AS candidates,
+                  SUM(ca.result = 'pass') AS passed, SUM(ca.result = 'fail') AS failed, SUM(ca.result = '') AS tied,
+                  cy.updated
+           FROM cycles cy LEFT JOIN candidates ca ON ca.cycle_id = cy.cycle_id
+           WHERE (:year IS NULL OR cy.examyear = :year)
+           GROUP BY cy.cycle_id ORDER BY cy.examyear'''),
+    'juror_required':("each juror's pass rate on required pieces, by cycle",
+        '''SELECT j.name AS juror, cy.examyear, COUNT(*) AS graded, SUM(g.grade = 'pass') AS passed,
+                  ROUND(100.0*SUM(g.grade = 'pass')/COUNT(*),1) AS pass_pct
+           FROM grades g JOIN jurors j ON j.juror_id = g.juror_id
+                JOIN candidates ca ON ca.candidate_id = g.candidate_id JOIN cycles cy ON cy.cycle_id = ca.cycle_id
+           WHERE g.required = 1 AND g.grade IN ('pass','fail')
+                 AND (:juror IS NULL OR j.name = :juror) AND (:year IS NULL OR cy.examyear = :year)
+           GROUP BY j.juror_id, cy.cycle_id ORDER BY j.name, cy.examyear'''),
+    'juror_pieces':("each juror's pass rate on all pieces, by cycle",
+        '''SELECT j.name AS juror, cy.examyear, COUNT(*) AS graded, SUM(g.grade = 'pass') AS passed,
+                  ROUND(100.0*SUM(g.grade = 'pass')/COUNT(*),1) AS pass_pct
+           FROM grades g JOIN jurors j ON j.juror_id = g.juror_id
+                JOIN candidates ca ON ca.candidate_id = g.candidate_id JOIN cycles cy ON cy.cycle_id = ca.cycle_id
+           WHERE g.grade IN ('pass','fail')
+                 AND (:juror IS NULL OR j.name = :juror) AND (:year IS NULL OR cy.examyear = :year)
+           GROUP BY j.juror_id, cy.cycle_id ORDER BY j.name, cy.examyear'''),
+    'juror_overall':("each juror's overall pass rate, and agreement with the result, by cycle",
+        '''SELECT j.name AS juror, cy.examyear, COUNT(*) AS marked, SUM(o.mark = 'pass') AS passed,
+                  ROUND(100.0*SUM(o.mark = 'pass')/COUNT(*),1) AS pass_pct,
+                  ROUND(100.0*SUM(o.mark = ca.result)/SUM(ca.result != ''),1) AS agree_pct
+           FROM overall o JOIN jurors j ON j.juror_id = o.juror_id
+                JOIN candidates ca ON ca.candidate_id = o.candidate_id JOIN cycles cy ON cy.cycle_id = ca.cycle_id
+           WHERE (:juror IS NULL OR j.name = :juror) AND (:year IS NULL OR cy.examyear = :year)
+           GROUP BY j.juror_id, cy.cycle_id ORDER BY j.name, cy.examyear'''),
+    'retakes':('candidates who failed and were examined again in a later cycle',
+        '''SELECT a.person, ca.examyear AS failed_year, a.number AS failed_number,
+                  cb.examyear AS retake_year, b.number AS retake_number, b.result AS retake_result
+           FROM candidates a JOIN cycles ca ON ca.cycle_id = a.cycle_id
+                JOIN candidates b ON b.person = a.person JOIN cycles cb ON cb.cycle_id = b.cycle_id
+           WHERE a.result = 'fail' AND cb.examyear > ca.examyear
+                 AND (:year IS NULL OR ca.examyear = :year)
+           ORDER BY a.person, ca.examyear, cb.examyear'''),
+    'split_votes':('candidates whose voting jurors were split within one vote',
+        '''SELECT cy.examyear, ca.number AS candidate, ca.numpass, ca.numfail, ca.result
+           FROM candidates ca JOIN cycles cy ON cy.cycle_id = ca.cycle_id
+           WHERE ABS(ca.numpass - ca.numfail) <= 1 AND (:year IS NULL OR cy.examyear = :year)
+           ORDER BY cy.examyear, CAST(ca.number AS INTEGER)'''),
+    'pieces':('pass rate of each piece over all cycles, most often graded first',
+        '''SELECT p.title AS piece, COUNT(DISTINCT g.candidate_id) AS candidates, COUNT(*) AS graded,
+                  ROUND(100.0*SUM(g.grade = 'pass')/COUNT(*),1) AS pass_pct
+           FROM grades g JOIN pieces p ON p.piece_id = g.piece_id
+                JOIN candidates ca ON ca.candidate_id = g.candidate_id JOIN cycles cy ON cy.cycle_id = ca.cycle_id
+           WHERE g.grade IN ('pass','fail') AND (:year IS NULL OR cy.examyear = :year)
+           GROUP BY p.piece_id ORDER BY graded DESC, p.title'''),
+    'required_votes':('required piece votes for each standard title, by cycle',
+        '''SELECT cy.examyear, p.title AS piece, COUNT(*) AS votes, COUNT(DISTINCT r.candidate_id) AS candidates
+           FROM reqvotes r JOIN pieces p ON p.piece_id = r.piece_id JOIN jurors j ON j.juror_id = r.juror_id
+                JOIN candidates ca ON ca.candidate_id = r.candidate_id JOIN cycles cy ON cy.cycle_id = ca.cycle_id
+           WHERE (:juror IS NULL OR j.name = :juror) AND (:year IS NULL OR cy.examyear = :year)
+           GROUP BY cy.cycle_id, p.piece_id ORDER BY cy.examyear, votes DESC, p.title'''),
+    'repertoire_votes':('repertoire piece points (3 for a 1st choice, 2 for 2nd, 1 for 3rd) for each title, by cycle',
+        '''SELECT cy.examyear, p.title AS piece, SUM(4 - r.choice) AS points, COUNT(*) AS votes,
+                  COUNT(DISTINCT r.candidate_id) AS candidates
+           FROM repvotes r JOIN pieces p ON p.piece_id = r.piece_id JOIN jurors j ON j.juror_id = r.juror_id
+                JOIN candidates ca ON ca.candidate_id = r.candidate_id JOIN cycles cy ON cy.cycle_id = ca.cycle_id
+           WHERE (:juror IS NULL OR j.name = :juror) AND (:year IS NULL OR cy.examyear = :year)
+           GROUP BY cy.cycle_id, p.piece_id ORDER BY cy.examyear, points DESC, p.title'''),
+    }
+
+
+def connect(dbfile):
+
+    # open database, creating the tables if needed
+    # repertoire votes stored with the piece title in repvotes (by earlier versions) are moved to piece ids
+
+    db = sqlite3.connect(dbfile)
+
+    oldrepvotes = 'piece' in [row[1] for row in db.execute('PRAGMA table_info(repvotes)')]
+    if oldrepvotes:
+        db.executescript('''DROP INDEX IF EXISTS repvotes_candidate;
+                            DROP INDEX IF EXISTS repvotes_juror;
+                            ALTER TABLE repvotes RENAME TO repvotes_titles;''')
+
+    db.executescript(schema)
+
+    if oldrepvotes:
+        with db:
+            db.execute('INSERT OR IGNORE INTO pieces (title) SELECT DISTINCT piece FROM repvotes_titles')
+            db.execute('INSERT INTO repvotes (candidate_id,piece_id,juror_id,choice) '
+                       'SELECT r.candidate_id, p.piece_id, r.juror_id, r.choice '
+                       'FROM repvotes_titles r JOIN pieces p ON p.title = r.piece')
+            db.execute('DROP TABLE repvotes_titles')
+
+    return db
+
+
+def row_ids(db,table,column,values):
+
+    # {value : id} for values in a name table (jurors, pieces), adding those not there yet
+
+    idcolumn = table[:-1]+'_id'
+    db.executemany('INSERT OR IGNORE INTO '+table+' ('+column+') VALUES (?)',[(value,) for value in set(values)])
+
+    ids = {}
+    for value,rowid in db.execute('SELECT '+column+', '+idcolumn+' FROM '+table):
+        ids[value] = rowid
+
+    return ids
+
+
+def store_cycle(dbfile,examyear,label,jurors,voting,results,votingsummary,required=None,persons=None):
+
+    # store one cycle's results, replacing any stored for the same exam year
+    # results and votingsummary are in the layout of results<year>.json and <year>votingsummary.json
+    # required is {candidate:[required piece titles]} as read from the adjudication forms, or None if not known
+    # persons is {candidate:lasting identifier} for following candidates across cycles
+
+    required = required if required is not None else {}
+    persons = persons or {}
+    summary_keys = ['pass','fail','required','repertoire']
+
+    db = connect(dbfile)
+    with db:
+        row = db.execute('SELECT cycle_id FROM cycles WHERE examyear = ?',(examyear,)).fetchone()
+        if row:
+            cycle = row[0]
+            for table in ['grades','overall','reqvotes','repvotes']:
+                db.execute('DELETE FROM '+table+' WHERE candidate_id IN (SELECT candidate_id FROM candidates WHERE cycle_id = ?)',
+                           (cycle,))
+            db.execute('DELETE FROM candidates WHERE cycle_id = ?',(cycle,))
+            db.execute('DELETE FROM cycle_jurors WHERE cycle_id = ?',(cycle,))
+            db.execute('UPDATE cycles SET label = ?, updated = ? WHERE cycle_id = ?',(label,time.strftime('%Y-%m-%dT%H:%M:%S'),cycle))
+        else:
+            cycle = db.execute('INSERT INTO cycles (examyear,label,updated) VALUES (?,?,?)',
+                               (examyear,label,time.strftime('%Y-%m-%dT%H:%M:%S'))).lastrowid
+
+        # everyone and everything named anywhere in the results
+        names = set(jurors) | set(voting)
+        titles = set()
+        for candidate,thisdict in results.items():
+            names.update(thisdict['pass'],thisdict['fail'])
+            for piece,jids in thisdict['required'].items():
+                titles.add(piece)
+                names.update(jids)
+            for piece,choices in thisdict['repertoire'].items():
+                titles.add(piece)
+                for jids in choices.values():
+                    names.update(jids)
+            for piece in thisdict:
+                if piece not in summary_keys:
+                    titles.add(piece)
+                    names.update(thisdict[piece])
+        jurorids = row_ids(db,'jurors','name',names)
+        pieceids = row_ids(db,'pieces','title',titles)
+
+        db.executemany('INSERT INTO cycle_jurors (cycle_id,juror_id,voting) VALUES (?,?,?)',
+                       [(cycle,jurorids[juror],int(juror in voting)) for juror in dict.fromkeys(list(jurors)+list(voting))])
+
+        grades = []
+        overall = []
+        reqvotes = []
+        repvotes = []
+        for candidate,thisdict in results.items():
+
+            summary = votingsummary.get(candidate,{})
+            numpass,numfail = summary.get('pass/fail',[None,None])
+            if numpass is None:
+                result = None
+            else:
+                result = 'pass' if numpass > numfail else 'fail' if numfail > numpass else ''
+            candid = db.execute('INSERT INTO candidates (cycle_id,number,person,numpass,numfail,result,reqpiece,reppiece) '
+                                'VALUES (?,?,?,?,?,?,?,?)',
+                                (cycle,candidate,persons.get(candidate),numpass,numfail,result,
+                                 summary.get('reqpiece'),summary.get('reppiece'))).lastrowid
+
+            thisvoting = set(summary.get('voting',[]))
+            if candidate in required:
+                reqpieces = set(required[candidate])
+            else:
+                reqpieces = None
+
+            for piece in thisdict:
+                if piece in summary_keys:
+                    continue
+                isreq = None if reqpieces is None else int(piece in reqpieces)
+                for juror,grade in thisdict[piece].items():
+                    grades.append((candid,pieceids[piece],jurorids[juror],grade if grade else None,isreq))
+
+            for mark in ['pass','fail']:
+                for juror in thisdict[mark]:
+                    overall.append((candid,jurorids[juror],mark,int(juror in thisvoting)))
+
+            for piece,jids in thisdict['required'].items():
+                for juror in jids:
+                    reqvotes.append((candid,pieceids[piece],jurorids[juror]))
+
+            for piece,choices in thisdict['repertoire'].items():
+                for choice,jids in choices.items():
+                    for juror in jids:
+                        repvotes.append((candid,pieceids[piece],jurorids[juror],int(choice)))
+
+        db.executemany('INSERT OR REPLACE INTO grades (candidate_id,piece_id,juror_id,grade,required) VALUES (?,?,?,?,?)',grades)
+        db.executemany('INSERT INTO overall (candidate_id,juror_id,mark,voting) VALUES (?,?,?,?)',overall)
+        db.executemany('INSERT INTO reqvotes (candidate_id,piece_id,juror_id) VALUES (?,?,?)',reqvotes)
+        db.executemany('INSERT INTO repvotes (candidate_id,piece_id,juror_id,choice) VALUES (?,?,?,?)',repvotes)
+
+    db.close()
+
+
+def run_query(dbfile,name,juror=None,year=None):
+
+    # run canned query; returns (column names, rows)
+
+    db = connect(dbfile)
+    cursor = db.execute(queries[name][1],{'juror':juror,'year':year})
+    rows = cursor.fetchall()
+    columns = [column[0] for column in cursor.description]
+    db.close()
+
+    return columns,rows
+
+
+def print_table(columns,rows):
+
+    # print query result as aligned columns
+
+    cells = [columns] + [['' if value is None else str(value) for value in row] for row in rows]
+    widths = [max(len(row[ind]) for row in cells) for ind in range(len(columns))]
+    for row in cells:
+        print('  '.join(value.ljust(width) for value,width in zip(row,widths)).rstrip())
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='results of all exam cycles in one SQLite database')
+    parser.add_argument('dbfile',help='database file, created if needed')
+    commands = parser.add_subparsers(dest='command',required=True)
+
+    commands.add_parser('queries',help='list the canned queries')
+
+    queryparser = commands.add_parser('query',help='run a canned query')
+    queryparser.add_argument('name',choices=sorted(queries))
+    queryparser.add_argument('--juror',help='only this juror')
+    queryparser.add_argument('--year',help='only this exam year')
+
+    loadparser = commands.add_parser('load',help="store an earlier cycle's results from its .json files")
+    loadparser.add_argument('examyear')
+    loadparser.add_argument('results',help='results<year>.json')
+    loadparser.add_argument('votingsummary',help='<year>votingsummary.json')
+    loadparser.add_argument('--label',default='final',help="'prelim' or 'final' (default final)")
+    loadparser.add_argument('--ids',metavar='FILE',help='.json of {candidate number : lasting identifier}, for retakes')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'queries':
+        for name in sorted(queries):
+            print('%-16s %s' % (name,queries[name][0]))
+
+    elif args.command == 'query':
+        columns,rows = run_query(args.dbfile,args.name,args.juror,args.year)
+        print_table(columns,rows)
+
+    elif args.command == 'load':
+        with open(args.results) as fh:
+            results = json.load(fh)
+        with open(args.votingsummary) as fh:
+            votingsummary = json.load(fh)
+        persons = {}
+        if args.ids:
+            with open(args.ids) as fh:
+                persons = json.load(fh)
+        jurors = sorted(set(juror for summary in votingsummary.values() for juror in summary['voting']) |
+                        set(juror for thisdict in results.values() for juror in thisdict['pass']+thisdict['fail']))
+        # the designated voting jurors aren't in the .json files; take all who voted for some candidate
+        voting = sorted(set(juror for summary in votingsummary.values() for juror in summary['voting']))
+        store_cycle(args.dbfile,args.examyear,args.label,jurors,voting,results,votingsummary,None,persons)
+        print(str(len(results))+' candidates of '+args.examyear+' stored in '+args.dbfile)
+
+
+if __name__ == '__main__':
+    main()